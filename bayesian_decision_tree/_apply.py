@@ -0,0 +1,79 @@
+"""Compiled routing kernels for the flattened tree: each kernel sends every sample from the root down to
+its leaf in one go (keeping the sample in registers for the whole traversal instead of routing all samples
+one tree level at a time) and writes the index of the reached leaf node into `out`. The kernels are serial
+and release the GIL, so they can be called from any thread; `BaseTree._apply()` runs them on chunks of the
+samples in parallel threads if n_jobs > 1.
+
+These kernels are only used if numba is installed, see `bayesian_decision_tree._numba`.
+"""
+
+from bayesian_decision_tree._numba import njit
+
+
+@njit(nogil=True, cache=True)
+def _csr_row_value(indptr, indices, data, row, dim):
+    for k in range(indptr[row], indptr[row + 1]):
+        if indices[k] == dim:
+            return data[k]
+
+    return 0.0
+
+
+@njit(nogil=True, cache=True)
+def apply_perpendicular_dense(X, feature, threshold, left, right, out):
+    for i in range(X.shape[0]):
+        node = 0
+        while left[node] != -1:
+            if X[i, feature[node]] >= threshold[node]:
+                node = right[node]
+            else:
+                node = left[node]
+
+        out[i] = node
+
+
+@njit(nogil=True, cache=True)
+def apply_perpendicular_csr(indptr, indices, data, feature, threshold, left, right, out):
+    for i in range(len(indptr) - 1):
+        node = 0
+        while left[node] != -1:
+            if _csr_row_value(indptr, indices, data, i, feature[node]) >= threshold[node]:
+                node = right[node]
+            else:
+                node = left[node]
+
+        out[i] = node
+
+
+@njit(nogil=True, cache=True)
+def apply_hyperplane_dense(X, normals, offsets, left, right, out):
+    for i in range(X.shape[0]):
+        node = 0
+        while left[node] != -1:
+            projection = 0.0
+            for dim in range(X.shape[1]):
+                projection += X[i, dim] * normals[node, dim]
+
+            if projection - offsets[node] >= 0:
+                node = right[node]
+            else:
+                node = left[node]
+
+        out[i] = node
+
+
+@njit(nogil=True, cache=True)
+def apply_hyperplane_csr(indptr, indices, data, normals, offsets, left, right, out):
+    for i in range(len(indptr) - 1):
+        node = 0
+        while left[node] != -1:
+            projection = 0.0
+            for k in range(indptr[i], indptr[i + 1]):
+                projection += data[k] * normals[node, indices[k]]
+
+            if projection - offsets[node] >= 0:
+                node = right[node]
+            else:
+                node = left[node]
+
+        out[i] = node
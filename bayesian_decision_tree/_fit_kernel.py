@@ -0,0 +1,379 @@
+"""Compiled split search kernels for perpendicular trees. The split search of a node scans all split
+candidates of all feature dimensions in one pass over the presorted data per dimension, accumulating the
+sufficient statistics of the left-hand side incrementally (the right-hand side follows from the totals),
+and returns the best split as a tuple (best_log_p_data_split, best_split_index, best_split_dimension).
+
+The model specific parts are the search along a single dimension, `find_best_split_along_dim_regression()`
+and `find_best_split_along_dim_classification()`, which `find_best_split()` runs for all dimensions, and an
+upper bound of the data log-likelihood of any n data points, `log_p_data_upper_bound_regression()` and
+`log_p_data_upper_bound_classification()`, which is used to skip dimensions whose splits can't possibly beat
+the best option found so far (see `BaseTree._compute_log_p_split_upper_bound()`). The model is selected by the
+`is_classification` flag rather than by passing these functions to the drivers, as compiled functions taking
+other compiled functions as arguments can't be reliably cached.
+
+`find_best_split()` searches the dimensions serially by default, releasing the GIL so that it can be called
+from any thread. The parallel driver is only used if the user opted in via n_jobs and the caller doesn't
+already parallelize over nodes, as numba's parallel kernels can't safely run in several threads at once with
+every threading layer.
+
+The log-gamma (and log) terms of the data log-likelihoods only depend on the number of data points (per class)
+on either side of a split, so they are looked up in tables computed once per node by
+`compute_log_p_data_tables()` instead of being evaluated for every split candidate.
+
+Split candidates are detected on `values_by_dim[dim, row]`, which is either the transposed data matrix or the
+value ranks of the data (see `BasePerpendicularTree._compute_value_ranks()`).
+
+These kernels are only used if numba is installed, see `bayesian_decision_tree._numba`.
+"""
+
+import math
+
+import numpy as np
+
+from bayesian_decision_tree._numba import njit, prange
+
+_LOG_2_PI = math.log(2 * math.pi)
+
+
+def find_best_split(
+    is_classification,
+    values_by_dim,
+    y,
+    sort_indices_by_dim,
+    split_precision,
+    prior,
+    partition_prior_level,
+    log_p_data_no_split,
+    parallel=False,
+):
+    find_best_split_impl = _find_best_split_parallel if parallel else _find_best_split_serial
+    return find_best_split_impl(
+        is_classification,
+        values_by_dim,
+        y,
+        sort_indices_by_dim,
+        split_precision,
+        prior,
+        partition_prior_level,
+        log_p_data_no_split,
+    )
+
+
+@njit(parallel=True, cache=True)
+def _find_best_split_parallel(
+    is_classification,
+    values_by_dim,
+    y,
+    sort_indices_by_dim,
+    split_precision,
+    prior,
+    partition_prior_level,
+    log_p_data_no_split,
+):
+    n_dim, n_data = sort_indices_by_dim.shape
+    log_p_data_tables = compute_log_p_data_tables(is_classification, n_data, prior)
+    best_log_p_by_dim = np.full(n_dim, -np.inf)
+    best_index_by_dim = np.full(n_dim, -1, dtype=np.int64)
+    for dim in prange(n_dim):
+        n_splits, first_split_index, last_split_index = _count_split_candidates(
+            values_by_dim[dim], sort_indices_by_dim[dim], split_precision
+        )
+        if n_splits == 0:
+            # no split possible along this dimension
+            continue
+
+        log_p_prior = math.log(partition_prior_level / (n_splits * n_dim))
+        log_p_data_bound = _log_p_data_split_upper_bound(
+            is_classification, prior, n_data, first_split_index, last_split_index
+        )
+        if log_p_prior + log_p_data_bound <= log_p_data_no_split:
+            # no split along this dimension can beat not splitting
+            continue
+
+        best_log_p, best_index = _find_best_split_along_dim(
+            is_classification,
+            values_by_dim[dim],
+            y,
+            sort_indices_by_dim[dim],
+            split_precision,
+            prior,
+            log_p_data_tables,
+        )
+        best_log_p_by_dim[dim] = log_p_prior + best_log_p
+        best_index_by_dim[dim] = best_index
+
+    return _reduce_best_split(best_log_p_by_dim, best_index_by_dim, log_p_data_no_split)
+
+
+@njit(nogil=True, cache=True)
+def _find_best_split_serial(
+    is_classification,
+    values_by_dim,
+    y,
+    sort_indices_by_dim,
+    split_precision,
+    prior,
+    partition_prior_level,
+    log_p_data_no_split,
+):
+    # same as _find_best_split_parallel() but releases the GIL instead, for callers running in threads, and
+    # skips dimensions which can't beat the best split found so far (not only those which can't beat not
+    # splitting), which is fine as _reduce_best_split() only accepts strictly better splits anyway
+    n_dim, n_data = sort_indices_by_dim.shape
+    log_p_data_tables = compute_log_p_data_tables(is_classification, n_data, prior)
+    best_log_p_by_dim = np.full(n_dim, -np.inf)
+    best_index_by_dim = np.full(n_dim, -1, dtype=np.int64)
+    best_log_p_so_far = log_p_data_no_split
+    for dim in range(n_dim):
+        n_splits, first_split_index, last_split_index = _count_split_candidates(
+            values_by_dim[dim], sort_indices_by_dim[dim], split_precision
+        )
+        if n_splits == 0:
+            # no split possible along this dimension
+            continue
+
+        log_p_prior = math.log(partition_prior_level / (n_splits * n_dim))
+        log_p_data_bound = _log_p_data_split_upper_bound(
+            is_classification, prior, n_data, first_split_index, last_split_index
+        )
+        if log_p_prior + log_p_data_bound <= best_log_p_so_far:
+            # no split along this dimension can beat the best option so far
+            continue
+
+        best_log_p, best_index = _find_best_split_along_dim(
+            is_classification,
+            values_by_dim[dim],
+            y,
+            sort_indices_by_dim[dim],
+            split_precision,
+            prior,
+            log_p_data_tables,
+        )
+        best_log_p_by_dim[dim] = log_p_prior + best_log_p
+        best_index_by_dim[dim] = best_index
+        best_log_p_so_far = max(best_log_p_so_far, best_log_p_by_dim[dim])
+
+    return _reduce_best_split(best_log_p_by_dim, best_index_by_dim, log_p_data_no_split)
+
+
+@njit(nogil=True, cache=True)
+def _count_split_candidates(values, sort_indices, split_precision):
+    # returns (n_splits, first_split_index, last_split_index), the latter two are only valid if n_splits > 0
+    n_splits = 0
+    first_split_index = -1
+    last_split_index = -1
+    for i in range(1, len(sort_indices)):
+        if abs(values[sort_indices[i]] - values[sort_indices[i - 1]]) > split_precision:
+            n_splits += 1
+            if first_split_index == -1:
+                first_split_index = i
+            last_split_index = i
+
+    return n_splits, first_split_index, last_split_index
+
+
+@njit(nogil=True, cache=True)
+def compute_log_p_data_tables(is_classification, n_data, prior):
+    if is_classification:
+        return log_p_data_tables_classification(n_data, prior)
+
+    return log_p_data_tables_regression(n_data, prior)
+
+
+@njit(nogil=True, cache=True)
+def _find_best_split_along_dim(is_classification, values, y, sort_indices, split_precision, prior, log_p_data_tables):
+    if is_classification:
+        return find_best_split_along_dim_classification(
+            values, y, sort_indices, split_precision, prior, log_p_data_tables
+        )
+
+    return find_best_split_along_dim_regression(values, y, sort_indices, split_precision, prior, log_p_data_tables)
+
+
+@njit(nogil=True, cache=True)
+def _log_p_data_upper_bound(is_classification, n, prior):
+    if is_classification:
+        return log_p_data_upper_bound_classification(n, prior)
+
+    return log_p_data_upper_bound_regression(n, prior)
+
+
+@njit(nogil=True, cache=True)
+def _log_p_data_split_upper_bound(is_classification, prior, n_data, first_split_index, last_split_index):
+    # see BaseTree._compute_log_p_split_upper_bound()
+    return max(
+        _log_p_data_upper_bound(is_classification, first_split_index, prior)
+        + _log_p_data_upper_bound(is_classification, n_data - first_split_index, prior),
+        _log_p_data_upper_bound(is_classification, last_split_index, prior)
+        + _log_p_data_upper_bound(is_classification, n_data - last_split_index, prior),
+    )
+
+
+@njit(nogil=True, cache=True)
+def _reduce_best_split(best_log_p_by_dim, best_index_by_dim, log_p_data_no_split):
+    # strict comparison so that the first dimension wins in case of ties, just like the NumPy code path
+    best_log_p_data_split = log_p_data_no_split
+    best_split_index = -1
+    best_split_dimension = -1
+    for dim in range(len(best_log_p_by_dim)):
+        if best_index_by_dim[dim] > 0 and best_log_p_by_dim[dim] > best_log_p_data_split:
+            best_log_p_data_split = best_log_p_by_dim[dim]
+            best_split_index = best_index_by_dim[dim]
+            best_split_dimension = dim
+
+    return best_log_p_data_split, best_split_index, best_split_dimension
+
+
+@njit(nogil=True, cache=True)
+def log_p_data_tables_regression(n_data, prior):
+    # rows: lgamma(alpha_post) and 0.5 * log(kappa / kappa_post) for n = 0, ..., n_data data points
+    kappa, alpha = prior[1], prior[2]
+    log_p_data_tables = np.empty((2, n_data + 1))
+    for n in range(n_data + 1):
+        log_p_data_tables[0, n] = math.lgamma(alpha + 0.5 * n)
+        log_p_data_tables[1, n] = 0.5 * math.log(kappa / (kappa + n))
+
+    return log_p_data_tables
+
+
+@njit(nogil=True, cache=True)
+def _log_p_data_regression(log_p_data_tables, mu, kappa, alpha, beta, log_p_const, n, y_sum, y_squared_sum):
+    # see BaseRegressionTree._compute_posterior_internal() and BaseRegressionTree._compute_log_p_data()
+    alpha_post = alpha + 0.5 * n
+    beta_post = beta + 0.5 * (y_squared_sum - y_sum**2 / n) + 0.5 * kappa * n * (y_sum / n - mu) ** 2 / (kappa + n)
+
+    return (
+        log_p_data_tables[0, n]
+        + log_p_const
+        - alpha_post * math.log(beta_post)
+        + log_p_data_tables[1, n]
+        - 0.5 * n * _LOG_2_PI
+    )
+
+
+@njit(nogil=True, cache=True)
+def log_p_data_upper_bound_regression(n, prior):
+    # see BaseRegressionTree._compute_log_p_data_upper_bound()
+    kappa, alpha, beta = prior[1], prior[2], prior[3]
+    return (
+        math.lgamma(alpha + 0.5 * n)
+        - math.lgamma(alpha)
+        - 0.5 * n * math.log(2 * math.pi * beta)
+        + 0.5 * math.log(kappa / (kappa + n))
+    )
+
+
+@njit(nogil=True, cache=True)
+def find_best_split_along_dim_regression(values, y, sort_indices, split_precision, prior, log_p_data_tables):
+    # returns (best_log_p_data_split, best_split_index), the caller makes sure that there is at least one split
+    n_data = len(sort_indices)
+    mu, kappa, alpha, beta = prior[0], prior[1], prior[2], prior[3]
+    log_p_const = -math.lgamma(alpha) + alpha * math.log(beta)
+
+    y_sum = 0.0
+    y_squared_sum = 0.0
+    for i in range(n_data):
+        y_i = y[sort_indices[i]]
+        y_sum += y_i
+        y_squared_sum += y_i * y_i
+
+    best_log_p = -np.inf
+    best_index = -1
+    y_sum1 = 0.0
+    y_squared_sum1 = 0.0
+    for i in range(1, n_data):
+        y_i = y[sort_indices[i - 1]]
+        y_sum1 += y_i
+        y_squared_sum1 += y_i * y_i
+        if abs(values[sort_indices[i]] - values[sort_indices[i - 1]]) <= split_precision:
+            # we can only split between *different* data points
+            continue
+
+        log_p = _log_p_data_regression(
+            log_p_data_tables, mu, kappa, alpha, beta, log_p_const, i, y_sum1, y_squared_sum1
+        ) + _log_p_data_regression(
+            log_p_data_tables,
+            mu,
+            kappa,
+            alpha,
+            beta,
+            log_p_const,
+            n_data - i,
+            y_sum - y_sum1,
+            y_squared_sum - y_squared_sum1,
+        )
+        if log_p > best_log_p:
+            best_log_p = log_p
+            best_index = i
+
+    return best_log_p, best_index
+
+
+@njit(nogil=True, cache=True)
+def log_p_data_tables_classification(n_data, prior):
+    # rows: lgamma(prior[c] + k) for each class c and lgamma(prior.sum() + k) for k = 0, ..., n_data data points
+    n_classes = len(prior)
+    prior_sum = prior.sum()
+    log_p_data_tables = np.empty((n_classes + 1, n_data + 1))
+    for k in range(n_data + 1):
+        for c in range(n_classes):
+            log_p_data_tables[c, k] = math.lgamma(prior[c] + k)
+
+        log_p_data_tables[n_classes, k] = math.lgamma(prior_sum + k)
+
+    return log_p_data_tables
+
+
+@njit(nogil=True, cache=True)
+def _log_p_data_classification(log_p_data_tables, k, n, betaln_prior):
+    # see BaseClassificationTree._compute_log_p_data_from_stats(), k are the class counts of the n data points
+    n_classes = len(k)
+    log_p = 0.0
+    for c in range(n_classes):
+        log_p += log_p_data_tables[c, k[c]]
+
+    return log_p - log_p_data_tables[n_classes, n] - betaln_prior
+
+
+@njit(nogil=True, cache=True)
+def log_p_data_upper_bound_classification(n, prior):
+    # see BaseClassificationTree._compute_log_p_data_upper_bound()
+    prior_max = prior.max()
+    prior_sum = prior.sum()
+    return math.lgamma(prior_max + n) - math.lgamma(prior_max) - math.lgamma(prior_sum + n) + math.lgamma(prior_sum)
+
+
+@njit(nogil=True, cache=True)
+def find_best_split_along_dim_classification(values, y, sort_indices, split_precision, prior, log_p_data_tables):
+    # returns (best_log_p_data_split, best_split_index), the caller makes sure that there is at least one split
+    n_data = len(sort_indices)
+    n_classes = len(prior)
+    betaln_prior = -math.lgamma(prior.sum())
+    for c in range(n_classes):
+        betaln_prior += math.lgamma(prior[c])
+
+    k_total = np.zeros(n_classes, dtype=np.int64)
+    for i in range(n_data):
+        k_total[int(y[sort_indices[i]])] += 1
+
+    best_log_p = -np.inf
+    best_index = -1
+    k1 = np.zeros(n_classes, dtype=np.int64)
+    k2 = np.empty(n_classes, dtype=np.int64)
+    for i in range(1, n_data):
+        k1[int(y[sort_indices[i - 1]])] += 1
+        if abs(values[sort_indices[i]] - values[sort_indices[i - 1]]) <= split_precision:
+            # we can only split between *different* data points
+            continue
+
+        for c in range(n_classes):
+            k2[c] = k_total[c] - k1[c]
+
+        log_p = _log_p_data_classification(log_p_data_tables, k1, i, betaln_prior) + _log_p_data_classification(
+            log_p_data_tables, k2, n_data - i, betaln_prior
+        )
+        if log_p > best_log_p:
+            best_log_p = log_p
+            best_index = i
+
+    return best_log_p, best_index
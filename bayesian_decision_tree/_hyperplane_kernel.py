@@ -0,0 +1,50 @@
+"""Compiled kernels for the hyperplane split search, see `HyperplaneOptimizationFunction`.
+
+The likelihood scan along a hyperplane normal reuses the per-dimension split search of the perpendicular
+trees (see `bayesian_decision_tree._fit_kernel`), with the projections of the data onto the normal in place
+of the values of a feature dimension.
+
+These kernels are only used if numba is installed, see `bayesian_decision_tree._numba`.
+"""
+
+import math
+
+import numpy as np
+
+from bayesian_decision_tree._fit_kernel import _count_split_candidates, _find_best_split_along_dim
+from bayesian_decision_tree._numba import njit
+
+
+@njit(nogil=True, cache=True)
+def sum_abs_distances(projections, offset):
+    # same as np.abs(projections - offset).sum() but in a single pass without temporary arrays
+    total = 0.0
+    for i in range(len(projections)):
+        total += abs(projections[i] - offset)
+
+    return total
+
+
+@njit(nogil=True, cache=True)
+def find_best_split_along_projection(
+    is_classification,
+    projections,
+    y,
+    sort_indices,
+    split_precision,
+    prior,
+    partition_prior_level,
+    n_dim,
+    log_p_data_tables,
+):
+    # returns (best_log_p_data_split, best_split_index) including the partition prior, best_split_index is -1 if
+    # the data can't be split along the projections; log_p_data_tables are the node's compute_log_p_data_tables()
+    n_splits, _, _ = _count_split_candidates(projections, sort_indices, split_precision)
+    if n_splits == 0:
+        return -np.inf, -1
+
+    best_log_p, best_index = _find_best_split_along_dim(
+        is_classification, projections, y, sort_indices, split_precision, prior, log_p_data_tables
+    )
+
+    return math.log(partition_prior_level / (n_splits * n_dim)) + best_log_p, best_index
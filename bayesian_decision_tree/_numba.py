@@ -0,0 +1,17 @@
+"""Optional numba support. numba is not a hard dependency of this package: if it isn't installed then
+`NUMBA_AVAILABLE` is False, the decorators below are no-ops and callers fall back to their NumPy code paths.
+"""
+
+try:
+    from numba import njit, prange
+
+    NUMBA_AVAILABLE = True
+except ImportError:  # pragma: no cover
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        return lambda function: function
@@ -2,9 +2,13 @@ from abc import ABC, abstractmethod
 
 import numpy as np
 import pandas as pd
-from scipy.sparse import csc_matrix, csr_matrix
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy.sparse import csc_matrix, csr_matrix, issparse
 from sklearn.base import BaseEstimator
 
+from bayesian_decision_tree._fit_kernel import find_best_split
+from bayesian_decision_tree._numba import NUMBA_AVAILABLE
+
 
 class BaseTree(ABC, BaseEstimator):
     """Abstract base class of all Bayesian decision tree models (classification and regression). Performs all
@@ -14,7 +18,9 @@ class BaseTree(ABC, BaseEstimator):
     inherit from two superclasses which in turn inherit from this class.
     """
 
-    def __init__(self, partition_prior, prior, delta, prune, child_type, is_regression, split_precision, level):
+    def __init__(
+        self, partition_prior, prior, delta, prune, child_type, is_regression, split_precision, level, n_jobs=None
+    ):
         self.partition_prior = partition_prior
         self.prior = prior
         self.delta = delta
@@ -23,6 +29,7 @@ class BaseTree(ABC, BaseEstimator):
         self.is_regression = is_regression
         self.split_precision = split_precision
         self.level = level
+        self.n_jobs = n_jobs
 
     def fit(self, X, y, verbose=False, feature_names=None):
         """Trains this classification or regression tree using the training set (X, y).
@@ -51,10 +58,7 @@ class BaseTree(ABC, BaseEstimator):
         .. [1] https://arxiv.org/abs/1901.03214
         """
         # validation and input transformation
-        if isinstance(y, list):
-            y = np.array(y)
-
-        y = y.squeeze()
+        y = np.asarray(y).squeeze()  # only copies if y isn't an array already (e.g. a list), squeeze() returns a view
         y = self._ensure_float64(y)
         self._check_target(y)
 
@@ -62,12 +66,22 @@ class BaseTree(ABC, BaseEstimator):
         if X.shape[0] != len(y):
             raise ValueError(f"Invalid shapes: X={X.shape}, y={y.shape}")
 
+        if issparse(X):
+            # column accesses coming up, so convert to CSC sparse matrix format once for the whole tree
+            # (this also covers the other sparse formats and the sparse array classes)
+            X = csc_matrix(X)
+            if not X.has_sorted_indices:
+                X = X.sorted_indices()
+
         # fit
+        self._invalidate_cached_tree_stats()
         self._fit(X, y, verbose, feature_names, "root")
 
         if self.prune:
             self._prune()
 
+        self._flatten_tree()
+
         return self
 
     def predict(self, X):
@@ -91,11 +105,9 @@ class BaseTree(ABC, BaseEstimator):
         X, _ = self._normalize_data_and_feature_names(X)
         self._ensure_is_fitted(X)
 
-        indices = np.arange(X.shape[0])
-        y = np.zeros(X.shape[0])
-        self._predict(X, indices, True, y)
+        leaf_indices = self._apply(X)
 
-        return y
+        return self.leaf_value_[leaf_indices]
 
     def feature_importance(self):
         """Compute and return feature importance of this tree after having fitted it to data. Feature
@@ -116,51 +128,127 @@ class BaseTree(ABC, BaseEstimator):
 
         return feature_importance
 
-    def _predict(self, X, indices, predict_class, y):
-        if self.is_leaf():
-            prediction = (
-                self._get_raw_leaf_data_internal()
-                if predict_class is None
-                else self._predict_leaf()
-                if predict_class
-                else self._compute_posterior_mean()
-            )
-            for i in indices:
-                y[i] = prediction
-        else:
-            dense = isinstance(X, np.ndarray)
-            if not dense and isinstance(X, csr_matrix):
-                # column accesses coming up, so convert to CSC sparse matrix format
-                X = csc_matrix(X)
-
-            # query both children, let them predict their side, and then re-assemble
-            indices1, indices2 = self._compute_child1_and_child2_indices(X, indices, dense)
-
-            if len(indices1) > 0:
-                self.child1_._predict(X, indices[indices1], predict_class, y)
-
-            if len(indices2) > 0:
-                self.child2_._predict(X, indices[indices2], predict_class, y)
+    def _apply(self, X):
+        """Returns the index of the leaf node (in the flattened tree) that each sample of X ends up in.
+        If numba is available then a compiled kernel routes each sample from the root to its leaf (in n_jobs
+        threads), otherwise all samples are routed down the tree simultaneously, one tree level per iteration.
+        """
+        self._ensure_is_flattened()
+
+        # sparse data is routed row by row (sparse DataFrames arrive as COO, which can't even be indexed)
+        dense = isinstance(X, np.ndarray)
+        if not dense:
+            X = csr_matrix(X)
+
+        if NUMBA_AVAILABLE:
+            # the compiled kernels are serial and release the GIL, so route contiguous chunks of the samples in
+            # parallel threads if requested
+            node_indices = np.empty(X.shape[0], dtype=np.int32)
+            n_jobs = min(effective_n_jobs(self.n_jobs), X.shape[0])
+            if n_jobs <= 1:
+                self._apply_compiled(X, dense, node_indices)
+            else:
+                bounds = np.linspace(0, X.shape[0], n_jobs + 1).astype(int)
+                Parallel(n_jobs=n_jobs, prefer="threads")(
+                    delayed(self._apply_compiled)(X[start:stop], dense, node_indices[start:stop])
+                    for start, stop in zip(bounds[:-1], bounds[1:])
+                )
+
+            return node_indices
+
+        node_indices = np.zeros(X.shape[0], dtype=np.int32)
+        active = np.flatnonzero(self.left_[node_indices] != -1)
+        while len(active) > 0:
+            nodes = node_indices[active]
+            go_right = self._compute_go_right(X, active, nodes, dense)
+            node_indices[active] = np.where(go_right, self.right_[nodes], self.left_[nodes])
+            active = active[self.left_[node_indices[active]] != -1]
+
+        return node_indices
+
+    def _flatten_tree(self):
+        """Flattens the fitted tree into arrays (breadth-first node order, root at index 0) such that
+        prediction doesn't need to recurse through the node objects.
+        """
+        nodes = [self]
+        left = []
+        right = []
+        i = 0
+        while i < len(nodes):
+            node = nodes[i]
+            if node.is_leaf():
+                left.append(-1)
+                right.append(-1)
+            else:
+                left.append(len(nodes))
+                nodes.append(node.child1_)
+                right.append(len(nodes))
+                nodes.append(node.child2_)
+
+            i += 1
+
+        self.nodes_ = nodes
+        self.left_ = np.array(left, dtype=np.int32)
+        self.right_ = np.array(right, dtype=np.int32)
+        self.leaf_value_ = np.array([node._predict_leaf() for node in nodes], dtype=np.float64)
+        self._flatten_split_info(nodes)
+
+    def _ensure_is_flattened(self):
+        if not hasattr(self, "left_"):
+            # e.g. a sub-tree of a fitted tree
+            self._flatten_tree()
+
+    def _gather_leaf_data(self, leaf_indices, get_leaf_data):
+        # only query each distinct leaf once
+        unique_leaf_indices, inverse = np.unique(leaf_indices, return_inverse=True)
+        leaf_data = np.array([get_leaf_data(self.nodes_[i]) for i in unique_leaf_indices])
+
+        return leaf_data[inverse]
+
+    def _fit_nodes(self, nodes_to_fit):
+        """Trains the tree level by level (breadth-first) instead of recursively. `nodes_to_fit` holds the
+        (node, args) pairs of all nodes of the current level that need training, `node._fit_node(*args)`
+        trains a single node and returns the (node, args) pairs of its children that need training.
+
+        If n_jobs > 1 then the nodes of a level are trained in parallel threads as soon as there are enough
+        of them to keep all threads busy. Until then, i.e. close to the root, each node parallelizes its own
+        split search instead. With the default n_jobs the split searches run serially (the compiled ones
+        releasing the GIL), so fit() can be called from any thread.
+        """
+        n_jobs = effective_n_jobs(self.n_jobs)
+        with Parallel(n_jobs=self.n_jobs, prefer="threads") as parallel:
+            while len(nodes_to_fit) > 0:
+                if n_jobs > 1 and len(nodes_to_fit) >= n_jobs:
+                    children_to_fit = parallel(
+                        delayed(node._fit_node)(*args, parallel=False) for node, args in nodes_to_fit
+                    )
+                else:
+                    children_to_fit = [node._fit_node(*args, parallel=n_jobs > 1) for node, args in nodes_to_fit]
+
+                nodes_to_fit = [child for children in children_to_fit for child in children]
 
     def _prune(self):
+        changed = True
+        while changed:
+            changed = self._prune_pass()
+
+    def _prune_pass(self):
+        # single post-order pass: prune both sub-trees first so that merges propagate upwards within
+        # the same pass, returns True if anything was pruned
         if self.is_leaf():
-            return
+            return False
 
-        depth_start = self.get_depth()
-        n_leaves_start = self.get_n_leaves()
+        changed1 = self.child1_._prune_pass()
+        changed2 = self.child2_._prune_pass()
 
         if self.child1_.is_leaf() and self.child2_.is_leaf():
             if self.child1_._predict_leaf() == self.child2_._predict_leaf():
                 # same prediction (class if classification, value if regression) -> no need to split
                 self._erase_split_info_base()
                 self._erase_split_info()
-        else:
-            self.child1_._prune()
-            self.child2_._prune()
+                return True
 
-        if depth_start != self.get_depth() or n_leaves_start != self.get_n_leaves():
-            # we did some pruning somewhere down this sub-tree -> prune again
-            self._prune()
+        return changed1 or changed2
 
     def _get_raw_leaf_data(self, X):
         """Returns the raw predicted leaf data.
@@ -183,11 +271,9 @@ class BaseTree(ABC, BaseEstimator):
         X, _ = self._normalize_data_and_feature_names(X)
         self._ensure_is_fitted(X)
 
-        indices = np.arange(X.shape[0])
-        raw_leaf_data = [None] * X.shape[0]
-        self._predict(X, indices, None, raw_leaf_data)
+        leaf_indices = self._apply(X)
 
-        return np.array(raw_leaf_data)
+        return self._gather_leaf_data(leaf_indices, lambda node: node._get_raw_leaf_data_internal())
 
     @abstractmethod
     def _update_feature_importance(self, feature_importance):
@@ -199,12 +285,11 @@ class BaseTree(ABC, BaseEstimator):
             if feature_names is None:
                 feature_names = X.columns
 
-            X = X.values
+            # keep sparse DataFrames sparse instead of densifying them
+            X = X.sparse.to_coo() if hasattr(X, "sparse") else X.values
         else:
-            if isinstance(X, list):
-                X = np.array(X)
-            elif np.isscalar(X):
-                X = np.array([X])
+            if not issparse(X):
+                X = np.atleast_1d(X)  # no copy if X is an array already
 
             if X.ndim == 1:
                 X = np.expand_dims(X, 0)
@@ -221,19 +306,9 @@ class BaseTree(ABC, BaseEstimator):
 
     @staticmethod
     def _ensure_float64(data):
-        if data.dtype in (
-            np.int8,
-            np.int16,
-            np.int32,
-            np.int64,
-            np.uint8,
-            np.uint16,
-            np.uint32,
-            np.uint64,
-            np.float32,
-            np.float64,
-        ):
-            return data
+        if data.dtype.kind in "biuf":
+            # bool, integer or float data converts directly (a no-op for float64), only object data needs checking
+            return data.astype(np.float64, copy=False)
 
         # convert to np.float64 for performance reasons (matrices with floats but of type object are very slow)
         X_float = data.astype(np.float64)
@@ -275,28 +350,38 @@ class BaseTree(ABC, BaseEstimator):
         return self._update_n_leaves(0)
 
     def _update_depth(self, depth):
-        if self.is_leaf():
-            return max(depth, self.level)
-        if self.child1_ is not None:
-            depth = self.child1_._update_depth(depth)
-            depth = self.child2_._update_depth(depth)
+        # the depth and leaf count of each sub-tree are cached, see _invalidate_cached_tree_stats()
+        if getattr(self, "_depth_cache", None) is None:
+            if self.is_leaf():
+                self._depth_cache = self.level
+            else:
+                self._depth_cache = self.child2_._update_depth(self.child1_._update_depth(0))
 
-        return depth
+        return max(depth, self._depth_cache)
 
     def _update_n_leaves(self, n_leaves):
-        if self.is_leaf():
-            return n_leaves + 1
-        if self.child1_ is not None:
-            n_leaves = self.child1_._update_n_leaves(n_leaves)
-            n_leaves = self.child2_._update_n_leaves(n_leaves)
-
-        return n_leaves
+        if getattr(self, "_n_leaves_cache", None) is None:
+            if self.is_leaf():
+                self._n_leaves_cache = 1
+            else:
+                self._n_leaves_cache = self.child2_._update_n_leaves(self.child1_._update_n_leaves(0))
+
+        return n_leaves + self._n_leaves_cache
+
+    def _invalidate_cached_tree_stats(self):
+        # the cached depth and leaf count of this node and all of its ancestors are affected by a change
+        node = self
+        while node is not None:
+            node._depth_cache = None
+            node._n_leaves_cache = None
+            node = getattr(node, "_parent", None)
 
     def _erase_split_info_base(self):
         self.child1_ = None
         self.child2_ = None
         self.log_p_data_no_split_ = None
         self.best_log_p_data_split_ = None
+        self._invalidate_cached_tree_stats()
 
     @abstractmethod
     def _get_prior(self, n_data, n_dim):
@@ -318,12 +403,81 @@ class BaseTree(ABC, BaseEstimator):
     def _compute_log_p_data_no_split(self, y, prior):
         raise NotImplementedError
 
+    def _compute_log_p_data_split(self, y, prior, n_dim, split_indices, cumulative_stats=None):
+        """Computes the data log-likelihoods of splitting the (sorted) targets y at each of the given split indices.
+        The sufficient statistics of the left-hand sides are looked up in the cumulative statistics of y and those
+        of the right-hand sides follow from the totals, so no re-summation over y is needed per split.
+        """
+        if cumulative_stats is None:
+            cumulative_stats = self._compute_cumulative_stats(y)
+
+        stats1 = cumulative_stats[split_indices - 1]
+        stats2 = cumulative_stats[-1] - stats1
+
+        n_splits = len(split_indices)
+        log_p_prior = np.log(self.partition_prior ** (1 + self.level) / (n_splits * n_dim))
+
+        log_p_data1 = self._compute_log_p_data_from_stats(stats1, prior)
+        log_p_data2 = self._compute_log_p_data_from_stats(stats2, prior)
+
+        return log_p_prior + log_p_data1 + log_p_data2
+
+    def _compute_log_p_split_upper_bound(self, prior, n_dim, n_data, n_splits=1, split_index_range=None):
+        """Computes an upper bound of the log-probabilities `_compute_log_p_data_split()` returns for splitting
+        `n_data` data points, given that there are `n_splits` split candidates, the first and last of which are
+        at the split indices `split_index_range` (default: 1 and n_data - 1, which together with `n_splits=1`
+        bounds any split of the data). The bound of the data log-likelihood of a split at index i, which is the
+        sum of `_compute_log_p_data_upper_bound()` of its two sides, is convex in i and therefore maximal at the
+        first or last split candidate. If the bound doesn't beat the best option found so far, there's no need
+        to search the splits.
+        """
+        first_split_index, last_split_index = split_index_range if split_index_range is not None else (1, n_data - 1)
+        split_indices = np.array([first_split_index, last_split_index])
+        log_p_data1 = self._compute_log_p_data_upper_bound(split_indices, prior)
+        log_p_data2 = self._compute_log_p_data_upper_bound(n_data - split_indices, prior)
+        log_p_prior = np.log(self.partition_prior ** (1 + self.level) / (n_splits * n_dim))
+
+        return log_p_prior + (log_p_data1 + log_p_data2).max()
+
+    @abstractmethod
+    def _compute_log_p_data_upper_bound(self, n, prior):
+        raise NotImplementedError
+
     @abstractmethod
-    def _compute_log_p_data_split(self, y, prior, n_dim, split_indices):
+    def _compute_cumulative_stats(self, y):
         raise NotImplementedError
 
     @abstractmethod
+    def _compute_log_p_data_from_stats(self, stats, prior):
+        raise NotImplementedError
+
+    def _find_best_split_compiled(
+        self, values_by_dim, y, sort_indices_by_dim, split_precision, prior, log_p_data_no_split, parallel=False
+    ):
+        return find_best_split(
+            not self.is_regression,
+            values_by_dim,
+            y,
+            sort_indices_by_dim,
+            split_precision,
+            np.asarray(prior, dtype=np.float64),
+            self.partition_prior ** (1 + self.level),
+            log_p_data_no_split,
+            parallel,
+        )
+
     def _compute_posterior(self, y, prior, delta=1):
+        if delta == 0:
+            return prior
+
+        return self._compute_posterior_from_stats(self._compute_stats(y), prior, delta)
+
+    @abstractmethod
+    def _compute_stats(self, y):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _compute_posterior_from_stats(self, stats, prior, delta=1):
         raise NotImplementedError
 
     @abstractmethod
@@ -342,9 +496,21 @@ class BaseTree(ABC, BaseEstimator):
     def _fit(self, X, y, verbose, feature_names, side_name):
         raise NotImplementedError
 
+    @abstractmethod
+    def _fit_node(self, *args, parallel=False):
+        raise NotImplementedError
+
     def __repr__(self):
         return self.__str__()
 
     @abstractmethod
-    def _compute_child1_and_child2_indices(self, X, indices, dense):
+    def _flatten_split_info(self, nodes):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _compute_go_right(self, X, rows, nodes, dense):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _apply_compiled(self, X, dense, out):
         raise NotImplementedError
@@ -1,9 +1,13 @@
+import io
 from abc import ABC
 
 import numpy as np
 from scipy.optimize._differentialevolution import DifferentialEvolutionSolver
-from scipy.sparse import csc_matrix, csr_matrix
 
+from bayesian_decision_tree._apply import apply_hyperplane_csr, apply_hyperplane_dense
+from bayesian_decision_tree._fit_kernel import compute_log_p_data_tables
+from bayesian_decision_tree._hyperplane_kernel import find_best_split_along_projection
+from bayesian_decision_tree._numba import NUMBA_AVAILABLE
 from bayesian_decision_tree.base import BaseTree
 from bayesian_decision_tree.hyperplane_optimization import HyperplaneOptimizationFunction, ScipyOptimizer
 
@@ -15,13 +19,55 @@ class BaseHyperplaneTree(BaseTree, ABC):
     """
 
     def __init__(
-        self, partition_prior, prior, delta, prune, child_type, is_regression, optimizer, split_precision, level
+        self,
+        partition_prior,
+        prior,
+        delta,
+        prune,
+        child_type,
+        is_regression,
+        optimizer,
+        split_precision,
+        level,
+        n_jobs=None,
+        use_fp32_projection=False,
     ):
-        BaseTree.__init__(self, partition_prior, prior, delta, prune, child_type, is_regression, split_precision, level)
+        BaseTree.__init__(
+            self, partition_prior, prior, delta, prune, child_type, is_regression, split_precision, level, n_jobs
+        )
 
         self.optimizer = optimizer
+        self.use_fp32_projection = use_fp32_projection
+
+    def _create_find_best_split_compiled(self, prior, n_data):
+        """Returns the compiled split search along the projections of this node's `n_data` data points onto a
+        hyperplane normal, see `HyperplaneOptimizationFunction` (which passes y and the prior as float64 arrays).
+        The log-likelihood lookup tables of the search are computed once here rather than for every hyperplane
+        normal.
+        """
+        is_classification = not self.is_regression
+        partition_prior_level = self.partition_prior ** (1 + self.level)
+        log_p_data_tables = compute_log_p_data_tables(is_classification, n_data, np.asarray(prior, dtype=np.float64))
+
+        def find_best_split_compiled(projections, y, sort_indices, split_precision, prior, n_dim):
+            return find_best_split_along_projection(
+                is_classification,
+                projections,
+                y,
+                sort_indices,
+                split_precision,
+                prior,
+                partition_prior_level,
+                n_dim,
+                log_p_data_tables,
+            )
+
+        return find_best_split_compiled
 
     def _fit(self, X, y, verbose, feature_names, side_name):
+        self._fit_nodes([(self, (X, y, verbose, feature_names, side_name))])
+
+    def _fit_node(self, X, y, verbose, feature_names, side_name, parallel=False):
         n_data = X.shape[0]
         n_dim = X.shape[1]
         prior = self._get_prior(n_data, n_dim)
@@ -30,44 +76,53 @@ class BaseHyperplaneTree(BaseTree, ABC):
             name = f"level {self.level} {side_name}"
             print(f"Training {name} with {n_data:10} data points")
 
-        dense = isinstance(X, np.ndarray)
-        if not dense and isinstance(X, csr_matrix):
-            # column accesses coming up, so convert to CSC sparse matrix format
-            X = csc_matrix(X)
-
         log_p_data_no_split = self._compute_log_p_data_no_split(y, prior)
+        stats = self._compute_stats(y)
 
         optimizer = self.optimizer
         if optimizer is None:
             # default to 'Differential Evolution' which works well and is reasonably fast
             optimizer = ScipyOptimizer(DifferentialEvolutionSolver, 666)
 
-        # the function to optimize (depends on X and y, hence we need to instantiate it for every data set anew)
-        optimization_function = HyperplaneOptimizationFunction(
-            X,
-            y,
-            prior,
-            self._compute_log_p_data_split,
-            log_p_data_no_split,
-            optimizer.search_space_is_unit_hypercube,
-            self.split_precision,
-        )
+        if self._compute_log_p_split_upper_bound(prior, n_dim, n_data) < log_p_data_no_split:
+            # no need to search for a hyperplane if not even the most likely split imaginable could beat not
+            # splitting (the optimization function accepts splits as good as not splitting, hence the strict
+            # comparison)
+            best_hyperplane_normal = None
+        else:
+            # the function to optimize (depends on X and y, hence we need to instantiate it for every data set anew)
+            optimization_function = HyperplaneOptimizationFunction(
+                X,
+                y,
+                prior,
+                self._compute_log_p_data_split,
+                log_p_data_no_split,
+                optimizer.search_space_is_unit_hypercube,
+                self.split_precision,
+                self.use_fp32_projection,
+                self._create_find_best_split_compiled(prior, n_data) if NUMBA_AVAILABLE else None,
+            )
 
-        # create and run optimizer
-        optimizer.solve(optimization_function)
+            # create and run optimizer
+            optimizer.solve(optimization_function)
 
-        self.optimization_function = optimization_function
+            # retrieve best hyperplane split from optimization function (and don't keep the function, which holds
+            # on to this node's data, alive while training the children)
+            best_hyperplane_normal = optimization_function.best_hyperplane_normal
+            best_hyperplane_origin = optimization_function.best_hyperplane_origin
+            best_log_p_data_split = optimization_function.best_log_p_data_split
+            del optimization_function
 
-        # retrieve best hyperplane split from optimization function
         self._erase_split_info_base()
         self._erase_split_info()
-        if optimization_function.best_hyperplane_normal is not None:
+        children_to_fit = []
+        if best_hyperplane_normal is not None:
             # split data and target to recursively train children
-            projections = X @ optimization_function.best_hyperplane_normal - np.dot(
-                optimization_function.best_hyperplane_normal, optimization_function.best_hyperplane_origin
-            )
-            indices1 = np.where(projections < 0)[0]
-            indices2 = np.where(projections >= 0)[0]
+            projections = X @ best_hyperplane_normal - np.dot(best_hyperplane_normal, best_hyperplane_origin)
+            is_child1 = projections < 0  # single comparison pass, the children are the mask and its complement
+            indices1 = np.flatnonzero(is_child1)
+            indices2 = np.flatnonzero(~is_child1)
+            del projections, is_child1
 
             if len(indices1) > 0 and len(indices2) > 0:
                 """
@@ -77,24 +132,24 @@ class BaseHyperplaneTree(BaseTree, ABC):
                 overwhelming the data likelihoods (which are of course identical between the 'all data' and
                 the 'everything on one side split' scenarios)s.
                 """
-                X1 = X[indices1]
-                X2 = X[indices2]
                 y1 = y[indices1]
                 y2 = y[indices2]
 
-                n_data1 = X1.shape[0]
-                n_data2 = X2.shape[0]
+                n_data1 = len(indices1)
+                n_data2 = len(indices2)
 
-                # compute posteriors of children and priors for further splitting
+                # compute posteriors of children and priors for further splitting (the sufficient statistics of
+                # the two children add up to this node's, so only child1's need to be computed from the data)
+                stats1 = self._compute_stats(y1)
                 prior_child1 = self._compute_posterior(y1, prior, delta=0)
                 prior_child2 = self._compute_posterior(y2, prior, delta=0)
 
                 # store split info, create children and continue training them if there's data left to split
-                self.best_hyperplane_normal_ = optimization_function.best_hyperplane_normal
-                self.best_hyperplane_origin_ = optimization_function.best_hyperplane_origin
+                self.best_hyperplane_normal_ = best_hyperplane_normal
+                self.best_hyperplane_origin_ = best_hyperplane_origin
 
-                self.log_p_data_no_split_ = optimization_function.log_p_data_no_split
-                self.best_log_p_data_split_ = optimization_function.best_log_p_data_split
+                self.log_p_data_no_split_ = log_p_data_no_split
+                self.best_log_p_data_split_ = best_log_p_data_split
 
                 self.child1_ = self.child_type(
                     self.partition_prior,
@@ -103,6 +158,8 @@ class BaseHyperplaneTree(BaseTree, ABC):
                     self.prune,
                     optimizer,
                     self.split_precision,
+                    self.n_jobs,
+                    self.use_fp32_projection,
                     self.level + 1,
                 )
                 self.child2_ = self.child_type(
@@ -112,40 +169,63 @@ class BaseHyperplaneTree(BaseTree, ABC):
                     self.prune,
                     optimizer,
                     self.split_precision,
+                    self.n_jobs,
+                    self.use_fp32_projection,
                     self.level + 1,
                 )
+                self.child1_._parent = self
+                self.child2_._parent = self
                 self.child1_._erase_split_info_base()
                 self.child2_._erase_split_info_base()
                 self.child1_._erase_split_info()
                 self.child2_._erase_split_info()
 
                 # fit children if there is more than one data point (i.e., there is
-                # something to split) and if the targets differ (no point otherwise)
+                # something to split) and if the targets differ (no point otherwise);
+                # this node's data is released as soon as the children's has been sliced
                 if n_data1 > 1 and len(np.unique(y1)) > 1:
-                    self.child1_._fit(X1, y1, verbose, feature_names, "back ")
+                    children_to_fit.append((self.child1_, (X[indices1], y1, verbose, feature_names, "back ")))
                 else:
-                    self.child1_.posterior_ = self._compute_posterior(y1, prior)
+                    self.child1_.posterior_ = self._compute_posterior_from_stats(stats1, prior)
                     self.child1_.n_data_ = n_data1
 
                 if n_data2 > 1 and len(np.unique(y2)) > 1:
-                    self.child2_._fit(X2, y2, verbose, feature_names, "front")
+                    children_to_fit.append((self.child2_, (X[indices2], y2, verbose, feature_names, "front")))
                 else:
-                    self.child2_.posterior_ = self._compute_posterior(y2, prior)
+                    self.child2_.posterior_ = self._compute_posterior_from_stats(stats - stats1, prior)
                     self.child2_.n_data_ = n_data2
 
         # compute posterior
         self.n_dim_ = X.shape[1]
         self.n_data_ = n_data
-        self.posterior_ = self._compute_posterior(y, prior)
+        self.posterior_ = self._compute_posterior_from_stats(stats, prior)
+
+        return children_to_fit
+
+    def _flatten_split_info(self, nodes):
+        self.normals_ = np.zeros((len(nodes), self.n_dim_))
+        self.offsets_ = np.zeros(len(nodes))
+        for i, node in enumerate(nodes):
+            if not node.is_leaf():
+                self.normals_[i] = node.best_hyperplane_normal_
+                self.offsets_[i] = np.dot(node.best_hyperplane_normal_, node.best_hyperplane_origin_)
+
+    def _compute_go_right(self, X, rows, nodes, dense):
+        normals = self.normals_[nodes]
+        if dense:
+            projections = np.einsum("ij,ij->i", X[rows], normals)
+        else:
+            projections = np.asarray(X[rows].multiply(normals).sum(axis=1)).ravel()
 
-    def _compute_child1_and_child2_indices(self, X, indices, dense):
-        projections = X[indices] @ self.best_hyperplane_normal_ - np.dot(
-            self.best_hyperplane_normal_, self.best_hyperplane_origin_
-        )
-        indices1 = np.where(projections < 0)[0]
-        indices2 = np.where(projections >= 0)[0]
+        return projections - self.offsets_[nodes] >= 0
 
-        return indices1, indices2
+    def _apply_compiled(self, X, dense, out):
+        if dense:
+            apply_hyperplane_dense(X, self.normals_, self.offsets_, self.left_, self.right_, out)
+        else:
+            apply_hyperplane_csr(
+                X.indptr, X.indices, X.data, self.normals_, self.offsets_, self.left_, self.right_, out
+            )
 
     def is_leaf(self):
         self._ensure_is_fitted()
@@ -182,32 +262,29 @@ class BaseHyperplaneTree(BaseTree, ABC):
         if not self.is_fitted():
             return "Unfitted model"
 
-        return self._str([], "\u251c", "\u2514", "\u2502", "\u2265", None)
+        out = io.StringIO()
+        self._str(out, "", "\u251c", "\u2514", "\u2502", "\u2265", None)
+        return out.getvalue()
 
-    def _str(self, anchor, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, is_back_child):
-        anchor_str = "".join(" " + a for a in anchor)
-        s = ""
+    def _str(self, out, anchor, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, is_back_child):
+        # writes this node's subtree into `out`; `anchor` is the tree drawing in front of this node's line
         if is_back_child is not None:
-            s += anchor_str + " {:5s}: ".format("back" if is_back_child else "front")
+            out.write(anchor + " {:5s}: ".format("back" if is_back_child else "front"))
 
         if self.is_leaf():
-            s += f"y={self._predict_leaf()}, n={self.n_data_}"
+            out.write(f"y={self._predict_leaf()}, n={self.n_data_}")
             if not self.is_regression:
-                s += f", p(y)={self._compute_posterior_mean()}"
+                out.write(f", p(y)={self._compute_posterior_mean()}")
         else:
-            s += f"HP(origin={self.best_hyperplane_origin_}, normal={self.best_hyperplane_normal_})"
+            out.write(f"HP(origin={self.best_hyperplane_origin_}, normal={self.best_hyperplane_normal_})")
+
+            # the children's anchors continue this node's anchor, with a bar if this node has a sibling below
+            anchor_children = "" if is_back_child is None else anchor[:-1] + (BAR if is_back_child else "  ")
 
             # 'back' child (the child that is on the side of the hyperplane opposite to the normal vector, or projection < 0)
-            s += "\n"
-            anchor_child1 = (
-                [VERT_RIGHT] if len(anchor) == 0 else (anchor[:-1] + [(BAR if is_back_child else "  "), VERT_RIGHT])
-            )
-            s += self.child1_._str(anchor_child1, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, True)
+            out.write("\n")
+            self.child1_._str(out, anchor_children + " " + VERT_RIGHT, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, True)
 
             # 'front' child (the child that is on same side of the hyperplane as the normal vector, or projection >= 0)
-            s += "\n"
-            anchor_child2 = (
-                [DOWN_RIGHT] if len(anchor) == 0 else (anchor[:-1] + [(BAR if is_back_child else "  "), DOWN_RIGHT])
-            )
-            s += self.child2_._str(anchor_child2, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, False)
-        return s
+            out.write("\n")
+            self.child2_._str(out, anchor_children + " " + DOWN_RIGHT, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, False)
@@ -1,8 +1,11 @@
+import io
 from abc import ABC
 
 import numpy as np
-from scipy.sparse import csc_matrix, csr_matrix
+from joblib import Parallel, delayed, effective_n_jobs
 
+from bayesian_decision_tree._apply import apply_perpendicular_csr, apply_perpendicular_dense
+from bayesian_decision_tree._numba import NUMBA_AVAILABLE
 from bayesian_decision_tree.base import BaseTree
 
 
@@ -12,8 +15,23 @@ class BasePerpendicularTree(BaseTree, ABC):
     the low-level work to subclasses.
     """
 
-    def __init__(self, partition_prior, prior, delta, prune, child_type, is_regression, split_precision, level):
-        BaseTree.__init__(self, partition_prior, prior, delta, prune, child_type, is_regression, split_precision, level)
+    def __init__(
+        self,
+        partition_prior,
+        prior,
+        delta,
+        prune,
+        child_type,
+        is_regression,
+        split_precision,
+        level,
+        n_jobs=None,
+        max_bins=None,
+    ):
+        BaseTree.__init__(
+            self, partition_prior, prior, delta, prune, child_type, is_regression, split_precision, level, n_jobs
+        )
+        self.max_bins = max_bins
 
     def prediction_paths(self, X):
         """Returns the prediction paths for X.
@@ -36,110 +54,123 @@ class BasePerpendicularTree(BaseTree, ABC):
         X, _ = self._normalize_data_and_feature_names(X)
         self._ensure_is_fitted(X)
 
-        paths = [[] for i in range(X.shape[0])]
-        self._update_prediction_paths(X, np.arange(X.shape[0]), paths)
+        # the path of each sample is the path to the leaf it ends up in, so compute the paths of all leaves
+        # once and route the samples through the flattened tree
+        leaf_indices = self._apply(X)
+        node_paths = self._compute_node_paths()
 
-        return paths
+        return [list(node_paths[i]) for i in leaf_indices]
 
-    def _update_prediction_paths(self, X, indices, paths):
-        if not self.is_leaf():
-            dense = isinstance(X, np.ndarray)
-            if not dense and isinstance(X, csr_matrix):
-                # column accesses coming up, so convert to CSC sparse matrix format
-                X = csc_matrix(X)
+    def _compute_node_paths(self):
+        # paths from the root to each node of the flattened tree (parents come before their children)
+        node_paths = [[] for _ in self.nodes_]
+        for i, node in enumerate(self.nodes_):
+            if self.left_[i] != -1:
+                step = (node.split_dimension_, node.split_feature_name_, node.split_value_, False)
+                node_paths[self.left_[i]] = node_paths[i] + [step]
+                step = (node.split_dimension_, node.split_feature_name_, node.split_value_, True)
+                node_paths[self.right_[i]] = node_paths[i] + [step]
 
-            indices1, indices2 = self._compute_child1_and_child2_indices(X, indices, dense)
-
-            if len(indices1) > 0:
-                step = (self.split_dimension_, self.split_feature_name_, self.split_value_, False)
-                for i in indices1:
-                    paths[i].append(step)
-
-            if len(indices2) > 0:
-                step = (self.split_dimension_, self.split_feature_name_, self.split_value_, True)
-                for i in indices2:
-                    paths[i].append(step)
-
-            if len(indices1) > 0 and not self.child1_.is_leaf():
-                paths1 = [paths[i] for i in indices1]
-                self.child1_._update_prediction_paths(X, indices1, paths1)
-
-            if len(indices2) > 0 and not self.child2_.is_leaf():
-                paths2 = [paths[i] for i in indices2]
-                self.child2_._update_prediction_paths(X, indices2, paths2)
+        return node_paths
 
     @staticmethod
     def _create_merged_paths_array(n_rows):
         return np.zeros((n_rows, 4))
 
-    def _fit(self, X, y, verbose, feature_names, side_name, sort_indices_by_dim=None):
-        n_data = sort_indices_by_dim.shape[1] if sort_indices_by_dim is not None else X.shape[0]
+    def _fit(self, X, y, verbose, feature_names, side_name):
+        n_data, n_dim = X.shape
+        dense = isinstance(X, np.ndarray)
+
+        # compute sort indices (only done once at the start)
+        dtype = np.uint16 if n_data < (1 << 16) else np.uint32 if n_data < (1 << 32) else np.uint64
+        sort_indices_by_dim = np.zeros(X.shape[::-1], dtype=dtype)
+        for dim in range(n_dim):
+            if dense:
+                sort_indices_by_dim[dim] = np.argsort(X[:, dim])
+            else:
+                sort_indices_by_dim[dim] = self._argsort_sparse_column(X, dim)
+
+        # scratch row mask shared by all nodes (nodes only ever touch their own, disjoint rows)
+        is_child1 = np.zeros(n_data, dtype=bool)
+
+        value_ranks_by_dim = None
+        if self.max_bins is not None:
+            if not 2 <= self.max_bins <= (1 << 16):
+                raise ValueError(f"max_bins must be between 2 and {1 << 16} but is {self.max_bins}")
+
+            value_ranks_by_dim = self._compute_value_ranks(X, sort_indices_by_dim, dense, self.max_bins)
+        elif self.split_precision == 0:
+            # split candidates are wherever the value rank changes, so nodes don't need to gather
+            # (or, for sparse data, look up) any data values to find them
+            value_ranks_by_dim = self._compute_value_ranks(X, sort_indices_by_dim, dense)
+
+        self._fit_nodes(
+            [(self, (X, y, verbose, feature_names, side_name, sort_indices_by_dim, is_child1, value_ranks_by_dim))]
+        )
+
+    def _fit_node(
+        self,
+        X,
+        y,
+        verbose,
+        feature_names,
+        side_name,
+        sort_indices_by_dim,
+        is_child1,
+        value_ranks_by_dim,
+        parallel=False,
+    ):
+        n_data = sort_indices_by_dim.shape[1]
 
         if verbose:
             name = f"level {self.level} {side_name}"
             print(f"Training {name} with {n_data:10} data points")
 
         dense = isinstance(X, np.ndarray)
-        if not dense and isinstance(X, csr_matrix):
-            # column accesses coming up, so convert to CSC sparse matrix format
-            X = csc_matrix(X)
-
         n_dim = X.shape[1]
 
-        # compute sort indices (only done once at the start)
-        if sort_indices_by_dim is None:
-            dtype = np.uint16 if n_data < (1 << 16) else np.uint32 if n_data < (1 << 32) else np.uint64
-            sort_indices_by_dim = np.zeros(X.shape[::-1], dtype=dtype)
-            for dim in range(n_dim):
-                X_dim = X[:, dim]
-                if not dense:
-                    X_dim = self._to_array(X_dim)
-
-                sort_indices_by_dim[dim] = np.argsort(X_dim)
-
         # compute data likelihood of not splitting and remember it as the best option so far
         prior = self._get_prior(n_data, n_dim)
         y_any = y[sort_indices_by_dim[0]]  # any dim works as the order doesn't matter
         log_p_data_no_split = self._compute_log_p_data_no_split(y_any, prior)
-        best_log_p_data_split = log_p_data_no_split
+        stats = self._compute_stats(y_any)
+        posterior = self._compute_posterior_from_stats(stats, prior)
+        del y_any  # don't keep a copy of y alive on every level of the recursion
+
+        # find the split with the highest data likelihood along all data dimensions, unless not even the most
+        # likely split imaginable could beat not splitting
+        if self._compute_log_p_split_upper_bound(prior, n_dim, n_data) <= log_p_data_no_split:
+            best_log_p_data_split, best_split_index, best_split_dimension = log_p_data_no_split, -1, -1
+        elif NUMBA_AVAILABLE and (value_ranks_by_dim is not None or dense):
+            if value_ranks_by_dim is not None:
+                values_by_dim, split_precision = value_ranks_by_dim, 0
+            else:
+                values_by_dim, split_precision = X.T, self.split_precision
 
-        # compute data likelihoods of all possible splits along all data dimensions
-        best_split_index = -1
-        best_split_dimension = -1
-        for dim in range(n_dim):
-            sort_indices = sort_indices_by_dim[dim]
-            X_dim_sorted = X[sort_indices, dim]
-            if not dense:
-                X_dim_sorted = self._to_array(X_dim_sorted)
-
-            split_indices = (
-                1 + np.where(np.abs(np.diff(X_dim_sorted)) > self.split_precision)[0]
-            )  # we can only split between *different* data points
-            if len(split_indices) == 0:
-                # no split possible along this dimension
-                continue
-
-            y_sorted = y[sort_indices]
-
-            # compute data likelihoods of all possible splits along this dimension and find split with highest data likelihood
-            log_p_data_split = self._compute_log_p_data_split(y_sorted, prior, n_dim, split_indices)
-            i_max = log_p_data_split.argmax()
-            if log_p_data_split[i_max] > best_log_p_data_split:
-                # remember new best split
-                best_log_p_data_split = log_p_data_split[i_max]
-                best_split_index = split_indices[i_max]  # data index of best split
-                best_split_dimension = dim
+            best_log_p_data_split, best_split_index, best_split_dimension = self._find_best_split_compiled(
+                values_by_dim, y, sort_indices_by_dim, split_precision, prior, log_p_data_no_split, parallel
+            )
+        else:
+            best_log_p_data_split, best_split_index, best_split_dimension = self._find_best_split(
+                X, y, sort_indices_by_dim, value_ranks_by_dim, prior, n_dim, log_p_data_no_split, dense, parallel
+            )
 
         # did we find a split that has a higher likelihood than the no-split likelihood?
+        children_to_fit = []
         if best_split_index > 0:
             # split data and target to recursively train children
             indices1 = sort_indices_by_dim[best_split_dimension, :best_split_index]
             indices2 = sort_indices_by_dim[best_split_dimension, best_split_index:]
 
-            # compute posteriors of children and priors for further splitting
-            prior = self._get_prior(n_data, n_dim)
-            prior_child1 = tuple(self._compute_posterior(y[indices1], prior, self.delta)) if self.delta != 0 else prior
-            prior_child2 = tuple(self._compute_posterior(y[indices2], prior, self.delta)) if self.delta != 0 else prior
+            # compute posteriors of children and priors for further splitting; the sufficient statistics of
+            # the two children add up to this node's, so only child1's need to be computed from the data
+            y1 = y[indices1]
+            stats1 = self._compute_stats(y1)
+            stats2 = stats - stats1
+            prior_child1 = prior_child2 = prior
+            if self.delta != 0:
+                prior_child1 = tuple(self._compute_posterior_from_stats(stats1, prior, self.delta))
+                prior_child2 = tuple(self._compute_posterior_from_stats(stats2, prior, self.delta))
 
             # store split info, create children and continue training them if there's data left to split
             self.split_dimension_ = best_split_dimension
@@ -149,11 +180,27 @@ class BasePerpendicularTree(BaseTree, ABC):
             self.best_log_p_data_split_ = best_log_p_data_split
 
             self.child1_ = self.child_type(
-                self.partition_prior, prior_child1, self.delta, self.prune, self.split_precision, self.level + 1
+                self.partition_prior,
+                prior_child1,
+                self.delta,
+                self.prune,
+                self.split_precision,
+                self.n_jobs,
+                self.max_bins,
+                self.level + 1,
             )
             self.child2_ = self.child_type(
-                self.partition_prior, prior_child2, self.delta, self.prune, self.split_precision, self.level + 1
+                self.partition_prior,
+                prior_child2,
+                self.delta,
+                self.prune,
+                self.split_precision,
+                self.n_jobs,
+                self.max_bins,
+                self.level + 1,
             )
+            self.child1_._parent = self
+            self.child2_._parent = self
             self.child1_._erase_split_info_base()
             self.child2_._erase_split_info_base()
             self.child1_._erase_split_info()
@@ -161,42 +208,136 @@ class BasePerpendicularTree(BaseTree, ABC):
 
             # fit children if there is more than one data point (i.e., there is
             # something to split) and if the targets differ (no point otherwise)
-            sort_indices_by_dim_1 = sort_indices_by_dim[np.isin(sort_indices_by_dim, indices1)].reshape(n_dim, -1)
-            sort_indices_by_dim_2 = sort_indices_by_dim[np.isin(sort_indices_by_dim, indices2)].reshape(n_dim, -1)
-            del sort_indices_by_dim  # help GC maybe?
-            n_data1 = sort_indices_by_dim_1.shape[1]
-            n_data2 = sort_indices_by_dim_2.shape[1]
-            y1 = y[indices1]
+            # partition the presorted indices of every dimension into those of the two children by looking up
+            # each row in a mask, which keeps them sorted and costs O(n_dim * n_data) instead of a set lookup;
+            # this is done in place (child1's rows first) and the children work on views of this node's block,
+            # so the whole tree is trained using the single buffer allocated at the root
+            n_data1 = len(indices1)
+            n_data2 = len(indices2)
+            is_child1[indices1] = True
+            in_child1 = is_child1[sort_indices_by_dim]
+            is_child1[indices1] = False
+            sort_indices_by_dim_2 = sort_indices_by_dim[~in_child1].reshape(n_dim, -1)
+            sort_indices_by_dim[:, :n_data1] = sort_indices_by_dim[in_child1].reshape(n_dim, -1)
+            sort_indices_by_dim[:, n_data1:] = sort_indices_by_dim_2
+            del in_child1
+            sort_indices_by_dim_1 = sort_indices_by_dim[:, :n_data1]
+            sort_indices_by_dim_2 = sort_indices_by_dim[:, n_data1:]
             if n_data1 > 1 and len(np.unique(y1)) > 1:
-                self.child1_._fit(X, y, verbose, feature_names, "LHS", sort_indices_by_dim_1)
+                children_to_fit.append(
+                    (
+                        self.child1_,
+                        (X, y, verbose, feature_names, "LHS", sort_indices_by_dim_1, is_child1, value_ranks_by_dim),
+                    )
+                )
             else:
-                self.child1_.posterior_ = self._compute_posterior(y1, prior)
+                self.child1_.posterior_ = self._compute_posterior_from_stats(stats1, prior)
                 self.child1_.n_data_ = n_data1
 
             y2 = y[indices2]
             if n_data2 > 1 and len(np.unique(y2)) > 1:
-                self.child2_._fit(X, y, verbose, feature_names, "RHS", sort_indices_by_dim_2)
+                children_to_fit.append(
+                    (
+                        self.child2_,
+                        (X, y, verbose, feature_names, "RHS", sort_indices_by_dim_2, is_child1, value_ranks_by_dim),
+                    )
+                )
             else:
-                self.child2_.posterior_ = self._compute_posterior(y2, prior)
+                self.child2_.posterior_ = self._compute_posterior_from_stats(stats2, prior)
                 self.child2_.n_data_ = n_data2
         else:
             self._erase_split_info_base()
             self._erase_split_info()
 
-        # compute posterior
+        # store posterior
         self.n_dim_ = n_dim
         self.n_data_ = n_data
-        self.posterior_ = self._compute_posterior(y_any, prior)  # any dim works as the order doesn't matter
+        self.posterior_ = posterior
+
+        return children_to_fit
+
+    def _find_best_split(
+        self, X, y, sort_indices_by_dim, value_ranks_by_dim, prior, n_dim, log_p_data_no_split, dense, parallel
+    ):
+        # compute data likelihoods of all possible splits along all data dimensions (in parallel if requested
+        # and worthwhile, and if the caller isn't parallelized itself)
+        def find_best_split_along_dim(dim):
+            value_ranks = value_ranks_by_dim[dim] if value_ranks_by_dim is not None else None
+            return self._find_best_split_along_dim(
+                X, y, dim, sort_indices_by_dim[dim], value_ranks, prior, n_dim, log_p_data_no_split, dense
+            )
 
-    def _compute_child1_and_child2_indices(self, X, indices, dense):
-        X_split = X[indices, self.split_dimension_]
+        if parallel and n_dim >= 3 and effective_n_jobs(self.n_jobs) > 1:
+            results = Parallel(n_jobs=self.n_jobs, prefer="threads")(
+                delayed(find_best_split_along_dim)(dim) for dim in range(n_dim)
+            )
+        else:
+            results = [find_best_split_along_dim(dim) for dim in range(n_dim)]
+
+        best_log_p_data_split = log_p_data_no_split
+        best_split_index = -1
+        best_split_dimension = -1
+        for dim, (log_p_data_split, split_index) in enumerate(results):
+            if split_index > 0 and log_p_data_split > best_log_p_data_split:
+                # remember new best split
+                best_log_p_data_split = log_p_data_split
+                best_split_index = split_index
+                best_split_dimension = dim
+
+        return best_log_p_data_split, best_split_index, best_split_dimension
+
+    def _find_best_split_along_dim(
+        self, X, y, dim, sort_indices, value_ranks, prior, n_dim, log_p_data_no_split, dense
+    ):
+        # we can only split between *different* data points
+        if value_ranks is not None:
+            ranks_sorted = value_ranks[sort_indices]
+            split_indices = 1 + np.flatnonzero(ranks_sorted[1:] != ranks_sorted[:-1])
+        else:
+            X_dim_sorted = X[sort_indices, dim] if dense else self._get_sparse_column_values(X, dim, sort_indices)
+            split_indices = 1 + np.where(np.abs(np.diff(X_dim_sorted)) > self.split_precision)[0]
+
+        if len(split_indices) == 0:
+            # no split possible along this dimension
+            return -np.inf, -1
+
+        n_splits = len(split_indices)
+        split_index_range = (split_indices[0], split_indices[-1])
+        if self._compute_log_p_split_upper_bound(prior, n_dim, len(sort_indices), n_splits, split_index_range) <= (
+            log_p_data_no_split
+        ):
+            # no split along this dimension can beat not splitting
+            return -np.inf, -1
+
+        # cumulative sufficient statistics of the sorted targets, computed once per dimension
+        cumulative_stats = self._compute_cumulative_stats(y[sort_indices])
+
+        # compute data likelihoods of all possible splits along this dimension and find split with highest data likelihood
+        log_p_data_split = self._compute_log_p_data_split(None, prior, n_dim, split_indices, cumulative_stats)
+        i_max = log_p_data_split.argmax()
+
+        return log_p_data_split[i_max], split_indices[i_max]  # data index of best split
+
+    def _flatten_split_info(self, nodes):
+        self.feature_ = np.array([node.split_dimension_ for node in nodes], dtype=np.intp)
+        self.threshold_ = np.array(
+            [np.nan if node.split_value_ is None else node.split_value_ for node in nodes], dtype=np.float64
+        )
+
+    def _compute_go_right(self, X, rows, nodes, dense):
+        X_split = X[rows, self.feature_[nodes]]
         if not dense:
-            X_split = self._to_array(X_split)
+            X_split = np.asarray(X_split).ravel()
 
-        indices1 = np.where(X_split < self.split_value_)[0]
-        indices2 = np.where(X_split >= self.split_value_)[0]
+        return X_split >= self.threshold_[nodes]
 
-        return indices1, indices2
+    def _apply_compiled(self, X, dense, out):
+        if dense:
+            apply_perpendicular_dense(X, self.feature_, self.threshold_, self.left_, self.right_, out)
+        else:
+            apply_perpendicular_csr(
+                X.indptr, X.indices, X.data, self.feature_, self.threshold_, self.left_, self.right_, out
+            )
 
     def is_leaf(self):
         self._ensure_is_fitted()
@@ -217,38 +358,92 @@ class BasePerpendicularTree(BaseTree, ABC):
         self.split_feature_name_ = None
 
     @staticmethod
-    def _to_array(sparse_array):
-        array = sparse_array.toarray()
-        return array[0] if array.shape == (1, 1) else array.squeeze()
+    def _compute_value_ranks(X, sort_indices_by_dim, dense, max_bins=None):
+        # dense rank of each data point's value within its dimension, i.e., the number of distinct smaller values,
+        # or, if max_bins is given, the index of the quantile bin the value falls into
+        if max_bins is None:
+            value_ranks_by_dim = np.empty_like(sort_indices_by_dim)
+        else:
+            value_ranks_by_dim = np.empty(sort_indices_by_dim.shape, dtype=np.uint8 if max_bins <= 256 else np.uint16)
+
+        n_data = sort_indices_by_dim.shape[1]
+        for dim, sort_indices in enumerate(sort_indices_by_dim):
+            if dense:
+                X_dim_sorted = X[sort_indices, dim]
+            else:
+                X_dim_sorted = BasePerpendicularTree._get_sparse_column_values(X, dim, sort_indices)
+
+            if max_bins is None:
+                ranks_sorted = np.zeros(n_data, dtype=value_ranks_by_dim.dtype)
+                np.cumsum(X_dim_sorted[1:] != X_dim_sorted[:-1], out=ranks_sorted[1:])
+            else:
+                bin_edges = np.unique(X_dim_sorted[(np.arange(1, max_bins) * n_data) // max_bins])
+                ranks_sorted = np.searchsorted(bin_edges, X_dim_sorted, side="right")
+
+            value_ranks_by_dim[dim, sort_indices] = ranks_sorted
+
+        return value_ranks_by_dim
+
+    @staticmethod
+    def _argsort_sparse_column(X, dim):
+        # only sort the stored values of the CSC column and put the rows of all (implicit or explicit)
+        # zeros in between the negative and the positive values
+        start, end = X.indptr[dim], X.indptr[dim + 1]
+        values_nz = X.data[start:end]
+        order = np.argsort(values_nz)
+        rows_nz = X.indices[start:end][order]
+        values_nz = values_nz[order]
+
+        is_zero = np.ones(X.shape[0], dtype=bool)
+        is_zero[rows_nz[values_nz != 0]] = False
+        n_negative = np.searchsorted(values_nz, 0, side="left")
+        i_positive = np.searchsorted(values_nz, 0, side="right")
+
+        return np.concatenate((rows_nz[:n_negative], np.flatnonzero(is_zero), rows_nz[i_positive:]))
+
+    @staticmethod
+    def _get_sparse_column_values(X, dim, rows):
+        # look the rows up in the (sorted) row indices of the CSC column instead of densifying the column
+        start, end = X.indptr[dim], X.indptr[dim + 1]
+        if start == end:
+            return np.zeros(len(rows), dtype=X.dtype)
+
+        rows_nz = X.indices[start:end]
+        positions = np.minimum(np.searchsorted(rows_nz, rows), end - start - 1)
+        values = X.data[start:end][positions]
+        values[rows_nz[positions] != rows] = 0
+
+        return values
 
     def __str__(self):
         if not self.is_fitted():
             return "Unfitted model"
 
-        return self._str([], self.split_value_, "\u251c", "\u2514", "\u2502", "\u2265", None)
+        out = io.StringIO()
+        self._str(out, "", self.split_value_, "\u251c", "\u2514", "\u2502", "\u2265", None)
+        return out.getvalue()
 
-    def _str(self, anchor, parent_split_value, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, is_left_child):
-        anchor_str = "".join(" " + a for a in anchor)
-        s = ""
+    def _str(self, out, anchor, parent_split_value, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, is_left_child):
+        # writes this node's subtree into `out`; `anchor` is the tree drawing in front of this node's line
         if is_left_child is not None:
-            s += anchor_str + " {}{}: ".format("<" if is_left_child else GEQ, parent_split_value)
+            out.write(anchor + " {}{}: ".format("<" if is_left_child else GEQ, parent_split_value))
 
         if self.is_leaf():
-            s += f"y={self._predict_leaf()}, n={self.n_data_}"
+            out.write(f"y={self._predict_leaf()}, n={self.n_data_}")
             if not self.is_regression:
-                s += f", p(y)={self._compute_posterior_mean()}"
+                out.write(f", p(y)={self._compute_posterior_mean()}")
         else:
-            s += f"{self.split_feature_name_}={self.split_value_}"
+            out.write(f"{self.split_feature_name_}={self.split_value_}")
+
+            # the children's anchors continue this node's anchor, with a bar if this node has a sibling below
+            anchor_children = "" if is_left_child is None else anchor[:-1] + (BAR if is_left_child else "  ")
 
-            s += "\n"
-            anchor_child1 = (
-                [VERT_RIGHT] if len(anchor) == 0 else (anchor[:-1] + [(BAR if is_left_child else "  "), VERT_RIGHT])
+            out.write("\n")
+            self.child1_._str(
+                out, anchor_children + " " + VERT_RIGHT, self.split_value_, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, True
             )
-            s += self.child1_._str(anchor_child1, self.split_value_, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, True)
 
-            s += "\n"
-            anchor_child2 = (
-                [DOWN_RIGHT] if len(anchor) == 0 else (anchor[:-1] + [(BAR if is_left_child else "  "), DOWN_RIGHT])
+            out.write("\n")
+            self.child2_._str(
+                out, anchor_children + " " + DOWN_RIGHT, self.split_value_, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, False
             )
-            s += self.child2_._str(anchor_child2, self.split_value_, VERT_RIGHT, DOWN_RIGHT, BAR, GEQ, False)
-        return s
@@ -6,6 +6,7 @@
 from abc import ABC
 
 import numpy as np
+from scipy.special import gammaln
 from sklearn.base import ClassifierMixin
 
 from bayesian_decision_tree.base import BaseTree
@@ -19,8 +20,10 @@ class BaseClassificationTree(BaseTree, ABC, ClassifierMixin):
     medium-level fitting and prediction tasks and outsources the low-level work to subclasses.
     """
 
-    def __init__(self, partition_prior, prior, delta, prune, child_type, split_precision, level=0):
-        BaseTree.__init__(self, partition_prior, prior, delta, prune, child_type, False, split_precision, level)
+    def __init__(self, partition_prior, prior, delta, prune, child_type, split_precision, level=0, n_jobs=None):
+        BaseTree.__init__(
+            self, partition_prior, prior, delta, prune, child_type, False, split_precision, level, n_jobs
+        )
 
     def predict_proba(self, X):
         """Predict class probabilities of the input samples X.
@@ -39,10 +42,9 @@ class BaseClassificationTree(BaseTree, ABC, ClassifierMixin):
         X, _ = self._normalize_data_and_feature_names(X)
         self._ensure_is_fitted(X)
 
-        y_proba = [None] * X.shape[0]
-        self._predict(X, np.arange(X.shape[0]), False, y_proba)
+        leaf_indices = self._apply(X)
 
-        return np.array(y_proba)
+        return self._gather_leaf_data(leaf_indices, lambda node: node._compute_posterior_mean())
 
     def _check_target(self, y):
         if y.ndim != 1:
@@ -66,45 +68,39 @@ class BaseClassificationTree(BaseTree, ABC, ClassifierMixin):
 
         return log_p_prior + log_p_data
 
-    def _compute_log_p_data_split(self, y, prior, n_dim, split_indices):
-        n_classes = len(prior)
-        k1 = np.empty(n_classes, dtype=object)
-        k2 = np.empty(n_classes, dtype=object)
-        for i in range(n_classes):
-            k1_and_total = (y == i).cumsum()
-            total = k1_and_total[-1]
-            k1[i] = k1_and_total[split_indices - 1]
-            k2[i] = total - k1[i]
+    def _compute_cumulative_stats(self, y):
+        # columns: class counts
+        return np.cumsum(y.reshape(-1, 1) == np.arange(len(self.prior)), axis=0)
 
-        n_splits = len(split_indices)
-        log_p_prior = np.log(self.partition_prior ** (1 + self.level) / (n_splits * n_dim))
+    def _compute_log_p_data_from_stats(self, stats, prior):
+        # see https://www.cs.ubc.ca/~murphyk/Teaching/CS340-Fall06/reading/bernoulli.pdf, equation (42)
+        # which can be expressed as a fraction of beta functions
+        return multivariate_betaln((prior + stats).T) - multivariate_betaln(prior)
 
-        betaln_prior = multivariate_betaln(prior)
-        log_p_data1 = self._compute_log_p_data(k1, prior, betaln_prior)
-        log_p_data2 = self._compute_log_p_data(k2, prior, betaln_prior)
+    def _compute_log_p_data_upper_bound(self, n, prior):
+        # the data likelihood (see _compute_log_p_data_from_stats()) is at most that of n data points all of the
+        # class with the largest prior pseudo-count, i.e., the product of (prior_max + j) / (prior_sum + j)
+        prior = np.asarray(prior, dtype=np.float64)
+        prior_max = prior.max()
+        prior_sum = prior.sum()
+        return gammaln(prior_max + n) - gammaln(prior_max) - gammaln(prior_sum + n) + gammaln(prior_sum)
 
-        return log_p_prior + log_p_data1 + log_p_data2
+    def _compute_stats(self, y):
+        # class counts (same layout as the rows of the cumulative stats)
+        return np.bincount(y.astype(np.intp), minlength=len(self.prior))
 
-    def _compute_posterior(self, y, prior, delta=1):
+    def _compute_posterior_from_stats(self, stats, prior, delta=1):
         if delta == 0:
             return prior
 
         # see https://en.wikipedia.org/wiki/Conjugate_prior#Discrete_distributions
-        y_reshaped = np.broadcast_to(y, (len(prior), len(y)))
-        classes = np.arange(len(prior)).reshape(-1, 1)
-        k = np.sum(y_reshaped == classes, axis=1)
-        posterior = prior + delta * k
+        posterior = prior + delta * stats
 
         return posterior
 
     def _compute_posterior_mean(self):
         return self.posterior_ / np.sum(self.posterior_)
 
-    def _compute_log_p_data(self, k, prior, betaln_prior):
-        # see https://www.cs.ubc.ca/~murphyk/Teaching/CS340-Fall06/reading/bernoulli.pdf, equation (42)
-        # which can be expressed as a fraction of beta functions
-        return multivariate_betaln(prior + k) - betaln_prior
-
     def _predict_leaf(self):
         # predict class
         return np.argmax(self.posterior_)
@@ -156,6 +152,20 @@ class PerpendicularClassificationTree(BasePerpendicularTree, BaseClassificationT
         Determines the minimum distance between two contiguous points to consider a split. If the distance is below
         this threshold, the points are considered to overlap along this direction.
 
+    n_jobs : int, default=None
+        The number of threads used to train the nodes of the tree (once a tree level has enough nodes),
+        to search the feature dimensions for the best split (until then) and to route the samples through
+        the tree when predicting. `None` means 1 and -1 means using all processors, see joblib. Note that
+        if n_jobs > 1 the compiled split search uses numba's parallel threading layer, which may not
+        support calling fit() from several threads at once; with the default the split search is serial.
+
+    max_bins : int, default=None
+        If set, the values of each feature dimension are binned into at most `max_bins` quantile bins
+        (with all data points of the same value in the same bin) at the start of training and splits are
+        only considered between different bins. This trades some accuracy for faster training on large
+        data sets. `None` means no binning, i.e., splits are considered between all distinct values.
+        Takes precedence over split_precision. Must be between 2 and 65536.
+
     level : DO NOT SET, ONLY USED BY SUBCLASSES
 
     See Also:
@@ -176,12 +186,24 @@ class PerpendicularClassificationTree(BasePerpendicularTree, BaseClassificationT
     See `demo_classification_perpendicular.py`.
     """
 
-    def __init__(self, partition_prior=0.99, prior=None, delta=0, prune=False, split_precision=0.0, level=0):
+    def __init__(
+        self,
+        partition_prior=0.99,
+        prior=None,
+        delta=0,
+        prune=False,
+        split_precision=0.0,
+        n_jobs=None,
+        max_bins=None,
+        level=0,
+    ):
         child_type = PerpendicularClassificationTree
         BasePerpendicularTree.__init__(
-            self, partition_prior, prior, delta, prune, child_type, False, split_precision, level
+            self, partition_prior, prior, delta, prune, child_type, False, split_precision, level, n_jobs, max_bins
+        )
+        BaseClassificationTree.__init__(
+            self, partition_prior, prior, delta, prune, child_type, split_precision, level, n_jobs
         )
-        BaseClassificationTree.__init__(self, partition_prior, prior, delta, prune, child_type, split_precision, level)
 
 
 class HyperplaneClassificationTree(BaseHyperplaneTree, BaseClassificationTree):
@@ -237,6 +259,16 @@ class HyperplaneClassificationTree(BaseHyperplaneTree, BaseClassificationTree):
         Determines the minimum distance between two contiguous points to consider a split. If the distance is below
         this threshold, the points are considered to overlap along this direction.
 
+    n_jobs : int, default=None
+        The number of threads used to train the nodes of the tree and to route the samples through the
+        tree when predicting. `None` means 1 and -1 means using all processors, see joblib.
+
+    use_fp32_projection : bool, default=False
+        If True, the data points are projected onto the candidate hyperplane normals in single precision,
+        which roughly halves the time of the projections on large data sets. The projections are only used
+        to order the data points along the normals, so this rarely changes the splits found, which are
+        still computed in double precision.
+
     level : DO NOT SET, ONLY USED BY SUBCLASSES
 
     See Also:
@@ -258,10 +290,32 @@ class HyperplaneClassificationTree(BaseHyperplaneTree, BaseClassificationTree):
     """
 
     def __init__(
-        self, partition_prior=0.99, prior=None, delta=None, prune=False, optimizer=None, split_precision=0.0, level=0
+        self,
+        partition_prior=0.99,
+        prior=None,
+        delta=None,
+        prune=False,
+        optimizer=None,
+        split_precision=0.0,
+        n_jobs=None,
+        use_fp32_projection=False,
+        level=0,
     ):
         child_type = HyperplaneClassificationTree
         BaseHyperplaneTree.__init__(
-            self, partition_prior, prior, delta, prune, child_type, False, optimizer, split_precision, level
+            self,
+            partition_prior,
+            prior,
+            delta,
+            prune,
+            child_type,
+            False,
+            optimizer,
+            split_precision,
+            level,
+            n_jobs,
+            use_fp32_projection,
+        )
+        BaseClassificationTree.__init__(
+            self, partition_prior, prior, delta, prune, child_type, split_precision, level, n_jobs
         )
-        BaseClassificationTree.__init__(self, partition_prior, prior, delta, prune, child_type, split_precision, level)
@@ -1,10 +1,17 @@
 from abc import ABC, abstractmethod
 
 import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
 from numpy.random import RandomState
-from scipy.sparse import csc_matrix, csr_matrix
+from scipy.sparse import csc_matrix
 
-from bayesian_decision_tree.utils import hypercube_to_hypersphere_surface, r2_series_generator
+from bayesian_decision_tree._hyperplane_kernel import sum_abs_distances
+from bayesian_decision_tree._numba import NUMBA_AVAILABLE
+from bayesian_decision_tree.utils import hypercube_to_hypersphere_surface, r2_series
+
+
+# the maximum number of projections computed at once by HyperplaneOptimizationFunction.evaluate_all()
+_MAX_PROJECTION_BLOCK_SIZE = 2**22
 
 
 class HyperplaneOptimizationFunction:
@@ -12,6 +19,11 @@ class HyperplaneOptimizationFunction:
     the normal vector of a hyperplane in `n_dim` dimensions. Given such a hyperplane normal the function
     computes the optimum split location (i.e., the origin of the hyperplane) in the data such that the
     data likelihood is maximized.
+
+    If given, `find_best_split_compiled(projections, y, sort_indices, split_precision, prior, n_dim)` scans the
+    split candidates along the projections of the data onto a normal in compiled code and returns the best one as
+    (log_p_data_split, split_index), or a split index of -1 if there's none; otherwise the split candidates are
+    found and evaluated by `compute_log_p_data_split()` in NumPy.
     """
 
     def __init__(
@@ -23,11 +35,35 @@ class HyperplaneOptimizationFunction:
         log_p_data_no_split,
         search_space_is_unit_hypercube,
         split_precision,
+        use_fp32_projection=False,
+        find_best_split_compiled=None,
     ):
+        # sparse data is projected column by column (see compute()), so make sure it's in CSC format once; dense
+        # data is projected by BLAS, which copies data that is neither C- nor Fortran-contiguous on every call
+        # (e.g. a column slice of a larger array), so copy such data once instead
+        self._is_dense = isinstance(X, np.ndarray)
+        if self._is_dense:
+            if not X.flags.c_contiguous and not X.flags.f_contiguous:
+                X = np.ascontiguousarray(X)
+        elif not isinstance(X, csc_matrix):
+            X = csc_matrix(X)
+
+        # the split search gathers y and reads the prior for every hyperplane normal, so convert them to contiguous
+        # float64 arrays once (which also keeps the compiled split search from being compiled for other types)
         self.X = X
-        self.y = y
-        self.prior = prior
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self._n_data, self._n_dim = X.shape
+
+        # optionally project a single precision copy of the data (see the use_fp32_projection parameter of the
+        # hyperplane trees) while still computing the hyperplane origins from the original data
+        if use_fp32_projection and X.dtype != np.float32:
+            self._X_projection = X.astype(np.float32)
+        else:
+            self._X_projection = X
+
+        self.prior = np.asarray(prior, dtype=np.float64)
         self.compute_log_p_data_split = compute_log_p_data_split
+        self.find_best_split_compiled = find_best_split_compiled
         self.log_p_data_no_split = log_p_data_no_split
         self.search_space_is_unit_hypercube = search_space_is_unit_hypercube
         self.split_precision = split_precision
@@ -37,74 +73,185 @@ class HyperplaneOptimizationFunction:
         self.best_log_p_data_split = log_p_data_no_split
         self.best_cumulative_distances = 0
         self.best_hyperplane_normal = None
-        self.best_hyperplane_origin = None
+        self.best_split_rows = None
+
+    @property
+    def best_hyperplane_origin(self):
+        """The origin of the best hyperplane found so far, or None. It's computed from the best split's rows on
+        demand rather than for every improvement, as extracting rows of sparse (CSC) data means scanning all of it.
+        """
+        if self.best_split_rows is None:
+            return None
+
+        return self._compute_hyperplane_origin(self.best_split_rows)
 
     def compute(self, hyperplane_normal):
-        self.function_evaluations += 1
+        log_p_data_split, hyperplane_normal, split_rows, projections = self._evaluate(hyperplane_normal)
+        self.update_best_split(log_p_data_split, hyperplane_normal, split_rows, projections)
+
+        return -log_p_data_split
+
+    def evaluate(self, hyperplane_normal):
+        """Computes the best split along the given hyperplane normal without updating the best split found so
+        far, which makes it safe to call concurrently. Returns the arguments of `update_best_split()`.
+        """
+        log_p_data_split, hyperplane_normal, split_rows, _ = self._evaluate(hyperplane_normal)
+
+        # don't hold on to the projections, there may be many evaluations in flight
+        return log_p_data_split, hyperplane_normal, split_rows
+
+    def evaluate_all(self, hyperplane_normals):
+        """Same as calling `evaluate()` for each of the `hyperplane_normals` (one per row) but maps them to the
+        hypersphere in one go and projects the data onto blocks of normals at once, which reads the data once per
+        block rather than once per normal. Returns a list of the results of `evaluate()`.
+        """
+        n_normals = len(hyperplane_normals)
+        if n_normals == 0:
+            return []
+
+        if self.search_space_is_unit_hypercube:
+            hyperplane_normals = hypercube_to_hypersphere_surface(hyperplane_normals, half_hypersphere=True)
+            hyperplane_normals = hyperplane_normals.reshape(n_normals, -1)
+
+        # limit the size of the projections of a block to about that of _MAX_PROJECTION_BLOCK_SIZE floats
+        block_size = max(1, _MAX_PROJECTION_BLOCK_SIZE // self._n_data)
+
+        results = []
+        for start in range(0, n_normals, block_size):
+            normals_block = [self._normalize(normal) for normal in hyperplane_normals[start : start + block_size]]
+            projections_block = self._project_all(np.array(normals_block))
+            for hyperplane_normal, projections in zip(normals_block, projections_block):
+                results.append(self._evaluate_projections(hyperplane_normal, projections)[:3])
 
+        return results
+
+    def _evaluate(self, hyperplane_normal):
         if self.search_space_is_unit_hypercube:
             hyperplane_normal = hypercube_to_hypersphere_surface(hyperplane_normal, half_hypersphere=True)
 
-        # catch some special cases and normalize to unit length
-        hyperplane_normal = np.nan_to_num(hyperplane_normal)
-        if np.all(hyperplane_normal == 0):
-            hyperplane_normal[0] = 1
+        hyperplane_normal = self._normalize(hyperplane_normal)
+        return self._evaluate_projections(hyperplane_normal, self._project(hyperplane_normal))
 
-        hyperplane_normal /= np.linalg.norm(hyperplane_normal)
+    @staticmethod
+    def _normalize(hyperplane_normal):
+        # normalize to unit length (into a new array, the caller's normal isn't modified), catching some special
+        # cases only if the norm says that there is one
+        norm = np.linalg.norm(hyperplane_normal)
+        if norm == 0 or not np.isfinite(norm):
+            hyperplane_normal = np.nan_to_num(hyperplane_normal)
+            if np.all(hyperplane_normal == 0):
+                hyperplane_normal[0] = 1
 
-        dense = isinstance(self.X, np.ndarray)
-        if not dense and isinstance(self.X, csr_matrix):
-            self.X = csc_matrix(self.X)
+            norm = np.linalg.norm(hyperplane_normal)
+
+        return hyperplane_normal / norm
+
+    def _evaluate_projections(self, hyperplane_normal, projections):
+        # see compute(), given the projections of the data onto the (normalized) hyperplane normal
+        if np.ptp(projections) <= self.split_precision:
+            # no two data points are further apart than the split precision, no need to sort them to find out that
+            # no split is possible along this dimension
+            return self.log_p_data_no_split, hyperplane_normal, None, projections
 
-        # compute distance of all points to the hyperplane: https://mathinsight.org/distance_point_plane
-        projections = self.X @ hyperplane_normal  # up to an additive constant which doesn't matter to distance ordering
         sort_indices = np.argsort(projections)
-        split_indices = (
-            1 + np.where(np.abs(np.diff(projections)) > self.split_precision)[0]
-        )  # we can only split between *different* data points
+
+        if self.find_best_split_compiled is not None:
+            # single compiled pass over the sorted data for both the split candidates and their likelihoods
+            log_p_data_split, best_split_index = self.find_best_split_compiled(
+                projections, self.y, sort_indices, self.split_precision, self.prior, self._n_dim
+            )
+            if best_split_index == -1:
+                # no split possible along this dimension
+                return self.log_p_data_no_split, hyperplane_normal, None, projections
+
+            split_rows = (sort_indices[best_split_index - 1], sort_indices[best_split_index])
+            return log_p_data_split, hyperplane_normal, split_rows, projections
+
+        # we can only split between *different* data points; the sorted projections are non-decreasing, so
+        # their differences need no abs()
+        projections_sorted = projections[sort_indices]
+        split_indices = 1 + np.flatnonzero(projections_sorted[1:] - projections_sorted[:-1] > self.split_precision)
+        del projections_sorted
         if len(split_indices) == 0:
             # no split possible along this dimension
-            return -self.log_p_data_no_split
+            return self.log_p_data_no_split, hyperplane_normal, None, projections
 
         y_sorted = self.y[sort_indices]
 
         # compute data likelihoods of all possible splits along this projection and find split with highest data likelihood
-        n_dim = self.X.shape[1]
-        log_p_data_split = self.compute_log_p_data_split(y_sorted, self.prior, n_dim, split_indices)
+        log_p_data_split = self.compute_log_p_data_split(y_sorted, self.prior, self._n_dim, split_indices)
         i_max = log_p_data_split.argmax()
-        if log_p_data_split[i_max] >= self.best_log_p_data_split:
-            best_split_index = split_indices[i_max]
-            p1 = self.X[sort_indices[best_split_index - 1]]
-            p2 = self.X[sort_indices[best_split_index]]
-            if not dense:
-                p1 = p1.toarray()[0]
-                p2 = p2.toarray()[0]
-
-            hyperplane_origin = 0.5 * (p1 + p2)  # middle between the points that are being split
-            projections_with_origin = projections - np.dot(hyperplane_normal, hyperplane_origin)
-            cumulative_distances = np.sum(np.abs(projections_with_origin))
-
-            if log_p_data_split[i_max] > self.best_log_p_data_split:
-                is_log_p_better_or_same_but_with_better_distance = True
-            else:
-                # accept new split with same log(p) only if it increases the cumulative distance of all points to the hyperplane
-                is_log_p_better_or_same_but_with_better_distance = cumulative_distances > self.best_cumulative_distances
 
-            if is_log_p_better_or_same_but_with_better_distance:
-                self.best_log_p_data_split = log_p_data_split[i_max]
-                self.best_cumulative_distances = cumulative_distances
-                self.best_hyperplane_normal = hyperplane_normal
-                self.best_hyperplane_origin = hyperplane_origin
+        # the rows of the two data points between which the split lies
+        best_split_index = split_indices[i_max]
+        split_rows = (sort_indices[best_split_index - 1], sort_indices[best_split_index])
+
+        return log_p_data_split[i_max], hyperplane_normal, split_rows, projections
+
+    def _project(self, hyperplane_normal):
+        # compute distance of all points to the hyperplane: https://mathinsight.org/distance_point_plane
+        # (up to an additive constant which doesn't matter to distance ordering)
+        return self._X_projection @ hyperplane_normal.astype(self._X_projection.dtype, copy=False)
+
+    def _project_all(self, hyperplane_normals):
+        # same as _project() for each of the hyperplane normals (one per row), with one matrix product
+        hyperplane_normals = hyperplane_normals.astype(self._X_projection.dtype, copy=False)
+        if self._is_dense:
+            return hyperplane_normals @ self._X_projection.T
+
+        return np.ascontiguousarray((self._X_projection @ hyperplane_normals.T).T)
+
+    def update_best_split(self, log_p_data_split, hyperplane_normal, split_rows, projections=None):
+        """Remembers the split computed by `evaluate()` if it's better than the best split found so far. The
+        `projections` of the data onto the normal are recomputed if needed and not given.
+        """
+        self.function_evaluations += 1
+
+        if split_rows is None or log_p_data_split < self.best_log_p_data_split:
+            return
+
+        if log_p_data_split > self.best_log_p_data_split:
+            # the cumulative distance is only needed to break ties, so it's only computed once there is one
+            cumulative_distances = None
+        else:
+            # accept new split with same log(p) only if it increases the cumulative distance of all points to the hyperplane
+            if self.best_cumulative_distances is None:
+                self.best_cumulative_distances = self._compute_cumulative_distances(
+                    self.best_hyperplane_normal, self.best_split_rows
+                )
+
+            cumulative_distances = self._compute_cumulative_distances(hyperplane_normal, split_rows, projections)
+            if cumulative_distances <= self.best_cumulative_distances:
+                return
+
+        self.best_log_p_data_split = log_p_data_split
+        self.best_cumulative_distances = cumulative_distances
+        self.best_hyperplane_normal = hyperplane_normal
+        self.best_split_rows = split_rows
+
+    def _compute_hyperplane_origin(self, split_rows):
+        # the middle between the points that are being split (both rows at once, sparse data is scanned only once)
+        p1, p2 = self.X[list(split_rows)] if self._is_dense else self.X[list(split_rows)].toarray()
+        return 0.5 * (p1 + p2)
 
-        return -log_p_data_split[i_max]
+    def _compute_cumulative_distances(self, hyperplane_normal, split_rows, projections=None):
+        # the cumulative distance of all points to the hyperplane
+        if projections is None:
+            projections = self._project(hyperplane_normal)
+
+        offset = np.dot(hyperplane_normal, self._compute_hyperplane_origin(split_rows))
+        if NUMBA_AVAILABLE:
+            return sum_abs_distances(projections, offset)
+
+        return np.sum(np.abs(projections - offset))
 
 
 class StrMixin:
     """Auto-generate `__str__()` and `__repr__()` from attributes."""
 
     def __str__(self):
-        attributes = [f"{k}={v}" for k, v in self.__dict__.items()]
-        return "{}[{}]".format(type(self).__name__, ", ".join(attributes))
+        attributes = ", ".join(f"{k}={v}" for k, v in vars(self).items())
+        return f"{type(self).__name__}[{attributes}]"
 
     def __repr__(self):
         return self.__str__()
@@ -120,6 +267,25 @@ class HyperplaneOptimizer(ABC, StrMixin):
     def solve(self, optimization_function):
         raise NotImplementedError
 
+    @staticmethod
+    def _compute_all(optimization_function, hyperplane_normals, n_jobs):
+        """Evaluates the optimization function for all `hyperplane_normals` (one per row) in blocks, see
+        `HyperplaneOptimizationFunction.evaluate_all()`, in `n_jobs` threads if requested (see joblib). The best
+        split is updated in the order of the normals either way, so the result doesn't depend on `n_jobs`.
+        """
+        n_jobs = effective_n_jobs(n_jobs)
+        if n_jobs == 1:
+            results = optimization_function.evaluate_all(hyperplane_normals)
+        else:
+            results_by_block = Parallel(n_jobs=n_jobs, prefer="threads")(
+                delayed(optimization_function.evaluate_all)(normals_block)
+                for normals_block in np.array_split(hyperplane_normals, n_jobs)
+            )
+            results = [result for results_block in results_by_block for result in results_block]
+
+        for result in results:
+            optimization_function.update_best_split(*result)
+
 
 class ScipyOptimizer(HyperplaneOptimizer):
     """An optimizer using one of the scipy global optimizers, see [1].
@@ -152,15 +318,17 @@ class ScipyOptimizer(HyperplaneOptimizer):
 
 class RandomTwoPointOptimizer(HyperplaneOptimizer):
     """An optimizer randomly choosing two points of different classes to construct
-    a bisecting hyperplane (experimental).
+    a bisecting hyperplane (experimental). The hyperplanes are evaluated in `n_jobs`
+    threads (`None` means 1 and -1 means using all processors, see joblib).
     TODO: Complete
     """
 
-    def __init__(self, n_mc, seed):
+    def __init__(self, n_mc, seed, n_jobs=None):
         super().__init__(search_space_is_unit_hypercube=False)
 
         self.n_mc = n_mc
         self.seed = seed
+        self.n_jobs = n_jobs
 
     def solve(self, optimization_function):
         rand = RandomState(self.seed)
@@ -179,49 +347,46 @@ class RandomTwoPointOptimizer(HyperplaneOptimizer):
             # can't pick two points of different classes if there aren't at least two classes
             return
 
-        # find indices of each class
+        # indices of the data points grouped by class, class c's being at class_starts[c]:class_starts[c + 1]
         n_classes = int(y.max()) + 1
-        class_indices = [np.where(y == i)[0] for i in range(n_classes)]
+        class_counts = np.bincount(y.astype(np.intp), minlength=n_classes)
+        class_starts = np.concatenate(([0], np.cumsum(class_counts)))
+        indices_by_class = np.argsort(y, kind="stable")
+
+        # draw all 'n_mc' pairs of points from two different (non-empty) classes at once
+        classes = np.flatnonzero(class_counts)
+        class1 = rand.randint(0, len(classes), self.n_mc)
+        class2 = rand.randint(0, len(classes) - 1, self.n_mc)
+        class2 += class2 >= class1  # skip class1 so that the two classes differ
+        class1 = classes[class1]
+        class2 = classes[class2]
+        indices1 = indices_by_class[class_starts[class1] + rand.randint(0, class_counts[class1])]
+        indices2 = indices_by_class[class_starts[class2] + rand.randint(0, class_counts[class2])]
 
         # evaluate 'n_mc' hyperplane normals passing through two random points form different classes
-        for i in range(self.n_mc):
-            indices1 = []
-            indices2 = []
-
-            while len(indices1) == 0 or len(indices2) == 0:
-                class1 = rand.randint(0, n_classes)
-                indices1 = class_indices[class1]
-
-                class2 = class1
-                while class2 == class1:
-                    class2 = rand.randint(0, n_classes)
-
-                indices2 = class_indices[class2]
+        hyperplane_normals = X[indices2] - X[indices1]
+        if not dense:
+            hyperplane_normals = hyperplane_normals.toarray()
 
-            p1 = X[indices1[rand.randint(0, len(indices1))]]
-            p2 = X[indices2[rand.randint(0, len(indices2))]]
-            if not dense:
-                p1 = p1.toarray()[0]
-                p2 = p2.toarray()[0]
+        # make sure the first coordinate is positive to match the scipy search space
+        hyperplane_normals[hyperplane_normals[:, 0] < 0] *= -1
 
-            normal = p2 - p1
-            if normal[0] < 0:
-                normal *= -1  # make sure the first coordinate is positive to match the scipy search space
-
-            optimization_function.compute(normal)
+        self._compute_all(optimization_function, hyperplane_normals, self.n_jobs)
 
 
 class RandomHyperplaneOptimizer(HyperplaneOptimizer):
     """An optimizer generating hyperplanes with random orientation
-    in space (experimental).
+    in space (experimental). The hyperplanes are evaluated in `n_jobs`
+    threads (`None` means 1 and -1 means using all processors, see joblib).
     TODO: Complete
     """
 
-    def __init__(self, n_mc, seed):
+    def __init__(self, n_mc, seed, n_jobs=None):
         super().__init__(search_space_is_unit_hypercube=False)
 
         self.n_mc = n_mc
         self.seed = seed
+        self.n_jobs = n_jobs
 
     def solve(self, optimization_function):
         rand = RandomState(self.seed)
@@ -229,21 +394,24 @@ class RandomHyperplaneOptimizer(HyperplaneOptimizer):
         X = optimization_function.X
         n_dim = X.shape[1]
 
-        for i in range(self.n_mc):
-            hyperplane_normal = rand.normal(0, 1, n_dim)
-            optimization_function.compute(hyperplane_normal)
+        # draw all normals at once (the same normals as when drawing them one by one)
+        hyperplane_normals = rand.normal(0, 1, (self.n_mc, n_dim))
+        self._compute_all(optimization_function, hyperplane_normals, self.n_jobs)
 
 
 class QuasiRandomHyperplaneOptimizer(HyperplaneOptimizer):
     """An optimizer generating hyperplanes with quasi-random orientation
     in space, see
     http://extremelearning.com.au/unreasonable-effectiveness-of-quasirandom-sequences/
+    The hyperplanes are evaluated in `n_jobs` threads (`None` means 1 and -1 means
+    using all processors, see joblib).
     """
 
-    def __init__(self, n):
+    def __init__(self, n, n_jobs=None):
         super().__init__(search_space_is_unit_hypercube=True)
 
         self.n = n
+        self.n_jobs = n_jobs
 
     def solve(self, optimization_function):
         X = optimization_function.X
@@ -251,10 +419,7 @@ class QuasiRandomHyperplaneOptimizer(HyperplaneOptimizer):
         n_dim_surface = n_dim - 1
 
         # quasi-random R2 sequence
-        r2gen = r2_series_generator(n_dim_surface)
-        for i in range(self.n):
-            uniform = next(r2gen)
-            optimization_function.compute(uniform)
+        self._compute_all(optimization_function, r2_series(n_dim_surface, self.n), self.n_jobs)
 
 
 class OptunaOptimizer(HyperplaneOptimizer):
@@ -269,14 +434,15 @@ class OptunaOptimizer(HyperplaneOptimizer):
         from optuna.logging import set_verbosity
         from optuna.samplers import TPESampler
 
-        study = create_study(direction="minimize", sampler=TPESampler(self.seed))
+        study = create_study(direction="minimize", sampler=TPESampler(seed=self.seed))
         n_dim = optimization_function.X.shape[1]
         n_dim_surface = n_dim - 1
+        param_names = [f"uniform[{i}]" for i in range(n_dim_surface)]
 
         def objective(trial):
-            uniform = np.zeros(n_dim_surface)
-            for i in range(n_dim_surface):
-                uniform[i] = trial.suggest_uniform(f"uniform[{i}]", 0, 1)
+            uniform = np.fromiter(
+                (trial.suggest_float(param_name, 0, 1) for param_name in param_names), float, n_dim_surface
+            )
 
             return optimization_function.compute(uniform)
 
@@ -303,48 +469,40 @@ class SimulatedAnnealingOptimizer(HyperplaneOptimizer):
         X = optimization_function.X
         n_dim = X.shape[1] - 1
 
-        candidates = {}
+        # the best candidates found so far, sorted by value (one candidate per value)
+        values = np.empty(0)
+        vectors = np.empty((0, n_dim))
 
         no_improvements = 0
         best_value = np.inf
 
         f = 1
         while no_improvements < 50:
-            if len(candidates) == 0:
+            if len(values) == 0:
                 # first run
-                for i in range(self.n_scan):
-                    candidate = rand.uniform(0, 1, n_dim)
-                    value = optimization_function.compute(candidate)
-                    candidates[value] = candidate
+                new_vectors = rand.uniform(0, 1, (self.n_scan, n_dim))
             else:
                 # evolution
-                vectors = list(candidates.values())
-                ranges = [np.max([v[i] for v in vectors]) - np.min([v[i] for v in vectors]) for i in range(n_dim)]
-
-                values_sorted = sorted(candidates.keys())
-                best_value = values_sorted[0]
-                for i in range(self.n_keep):
-                    i_candidate = i * len(values_sorted) // self.n_keep
-                    candidate = candidates[values_sorted[i_candidate]]
-                    # perturbation = ranges * rand.uniform(-1, 1, len(ranges))
-                    perturbation = f * rand.uniform(-1, 1, len(ranges))
-                    new_candidate = candidate + perturbation
-                    new_candidate = np.clip(new_candidate, 0, 1)
-                    value = optimization_function.compute(new_candidate)
-                    candidates[value] = new_candidate
+                best_value = values[0]
+                i_candidates = np.arange(self.n_keep) * len(values) // self.n_keep
+                perturbations = f * rand.uniform(-1, 1, (self.n_keep, n_dim))
+                new_vectors = np.clip(vectors[i_candidates] + perturbations, 0, 1)
 
                 f *= self.spread_factor
 
-            # only keep the best candidates
-            values_sorted = sorted(candidates.keys())
-            values_sorted = values_sorted[: self.n_keep]
-            if values_sorted[0] < best_value:
+            new_values = np.array([optimization_function.compute(vector) for vector in new_vectors])
+
+            # only keep the best candidates (of several candidates with the same value, the latest one)
+            values = np.concatenate((values, new_values))[::-1]
+            vectors = np.concatenate((vectors, new_vectors))[::-1]
+            values, unique_indices = np.unique(values, return_index=True)
+            values = values[: self.n_keep]
+            vectors = vectors[unique_indices[: self.n_keep]]
+            if values[0] < best_value:
                 no_improvements = 0
             else:
                 no_improvements += 1
 
-            candidates = {v: candidates[v] for v in values_sorted}
-
 
 class GradientDescentOptimizer(HyperplaneOptimizer):
     """A simple gradient descent optimizer (experimental).
@@ -391,16 +549,15 @@ class GradientDescentOptimizer(HyperplaneOptimizer):
                     while True:
                         delta_too_small = False
 
+                        # forward differences (backward ones at the upper border of the search space); the
+                        # function is piecewise constant, so give up on this step size as soon as it doesn't
+                        # change along a dimension
+                        deltas = np.where(candidate + delta > 1, -delta, delta)
                         for i_dim in range(n_dim):
                             new_candidate = candidate.copy()
-                            new_candidate[i_dim] += delta
-                            if new_candidate[i_dim] > 1:
-                                delta *= -1
-                                new_candidate[i_dim] = candidate[i_dim] + delta
-
+                            new_candidate[i_dim] += deltas[i_dim]
                             new_value = optimization_function.compute(new_candidate)
-                            gradient[i_dim] = (new_value - value) / delta
-                            delta = np.abs(delta)
+                            gradient[i_dim] = (new_value - value) / deltas[i_dim]
                             if gradient[i_dim] == 0:
                                 delta_too_small = True
                                 break
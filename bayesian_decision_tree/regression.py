@@ -19,8 +19,10 @@ class BaseRegressionTree(BaseTree, ABC, RegressorMixin):
     medium-level fitting and prediction tasks and outsources the low-level work to subclasses.
     """
 
-    def __init__(self, partition_prior, prior, delta, prune, child_type, split_precision, level=0):
-        BaseTree.__init__(self, partition_prior, prior, delta, prune, child_type, True, split_precision, level)
+    def __init__(self, partition_prior, prior, delta, prune, child_type, split_precision, level=0, n_jobs=None):
+        BaseTree.__init__(
+            self, partition_prior, prior, delta, prune, child_type, True, split_precision, level, n_jobs
+        )
 
     def _check_target(self, y):
         if y.ndim != 1:
@@ -36,36 +38,26 @@ class BaseRegressionTree(BaseTree, ABC, RegressorMixin):
 
         return log_p_prior + log_p_data
 
-    def _compute_log_p_data_split(self, y, prior, n_dim, split_indices):
-        n = len(y)
-        n1 = np.arange(1, n)
-        n2 = n - n1
-        y_sum1 = y.cumsum()[:-1]
-        y_sum2 = y.sum() - y_sum1
-        y_squared_sum1 = (y[:-1] ** 2).cumsum()
-        y_squared_sum2 = (y**2).sum() - y_squared_sum1
-
-        if len(split_indices) != len(y) - 1:
-            # we are *not* splitting between all data points -> indexing necessary
-            split_indices_minus_1 = split_indices - 1
+    def _compute_cumulative_stats(self, y):
+        # columns: data point count, sum of y, sum of y^2
+        return np.cumsum(np.column_stack((np.ones(len(y)), y, y**2)), axis=0)
 
-            n1 = n1[split_indices_minus_1]
-            n2 = n2[split_indices_minus_1]
-            y_sum1 = y_sum1[split_indices_minus_1]
-            y_sum2 = y_sum2[split_indices_minus_1]
-            y_squared_sum1 = y_squared_sum1[split_indices_minus_1]
-            y_squared_sum2 = y_squared_sum2[split_indices_minus_1]
-
-        mu1, kappa1, alpha1, beta1 = self._compute_posterior_internal(prior, n1, y_sum1, y_squared_sum1)
-        mu2, kappa2, alpha2, beta2 = self._compute_posterior_internal(prior, n2, y_sum2, y_squared_sum2)
-
-        n_splits = len(split_indices)
-        log_p_prior = np.log(self.partition_prior ** (1 + self.level) / (n_splits * n_dim))
+    def _compute_log_p_data_from_stats(self, stats, prior):
+        n, y_sum, y_squared_sum = stats.T
+        mu_post, kappa_post, alpha_post, beta_post = self._compute_posterior_internal(prior, n, y_sum, y_squared_sum)
 
-        log_p_data1 = self._compute_log_p_data(prior, alpha1, beta1, kappa1, n1)
-        log_p_data2 = self._compute_log_p_data(prior, alpha2, beta2, kappa2, n2)
+        return self._compute_log_p_data(prior, alpha_post, beta_post, kappa_post, n)
 
-        return log_p_prior + log_p_data1 + log_p_data2
+    def _compute_log_p_data_upper_bound(self, n, prior):
+        # the data likelihood (see _compute_log_p_data()) is at most that of data points all equal to mu, for
+        # which beta_new = beta
+        mu, kappa, alpha, beta = prior
+        return (
+            gammaln(alpha + 0.5 * n)
+            - gammaln(alpha)
+            - 0.5 * n * np.log(2 * np.pi * beta)
+            + 0.5 * np.log(kappa / (kappa + n))
+        )
 
     def _get_prior(self, n_data, n_dim):
         if self.prior is not None:
@@ -79,13 +71,15 @@ class BaseRegressionTree(BaseTree, ABC, RegressorMixin):
         beta = alpha / tau
         return np.array([mu, kappa, alpha, beta])
 
-    def _compute_posterior(self, y, prior, delta=1):
+    def _compute_stats(self, y):
+        # data point count, sum of y, sum of y^2 (same layout as the rows of the cumulative stats)
+        return np.array([len(y), y.sum(), (y**2).sum()])
+
+    def _compute_posterior_from_stats(self, stats, prior, delta=1):
         if delta == 0:
             return prior
 
-        n = len(y)
-        y_sum = y.sum()
-        y_squared_sum = (y**2).sum()
+        n, y_sum, y_squared_sum = stats
 
         return self._compute_posterior_internal(prior, n, y_sum, y_squared_sum, delta)
 
@@ -165,6 +159,20 @@ class PerpendicularRegressionTree(BasePerpendicularTree, BaseRegressionTree):
         Determines the minimum distance between two contiguous points to consider a split. If the distance is below
         this threshold, the points are considered to overlap along this direction.
 
+    n_jobs : int, default=None
+        The number of threads used to train the nodes of the tree (once a tree level has enough nodes),
+        to search the feature dimensions for the best split (until then) and to route the samples through
+        the tree when predicting. `None` means 1 and -1 means using all processors, see joblib. Note that
+        if n_jobs > 1 the compiled split search uses numba's parallel threading layer, which may not
+        support calling fit() from several threads at once; with the default the split search is serial.
+
+    max_bins : int, default=None
+        If set, the values of each feature dimension are binned into at most `max_bins` quantile bins
+        (with all data points of the same value in the same bin) at the start of training and splits are
+        only considered between different bins. This trades some accuracy for faster training on large
+        data sets. `None` means no binning, i.e., splits are considered between all distinct values.
+        Takes precedence over split_precision. Must be between 2 and 65536.
+
     level : DO NOT SET, ONLY USED BY SUBCLASSES
 
     See Also:
@@ -204,12 +212,24 @@ class PerpendicularRegressionTree(BasePerpendicularTree, BaseRegressionTree):
     See `demo_regression_perpendicular.py`.
     """
 
-    def __init__(self, partition_prior=0.99, prior=None, delta=0, prune=False, split_precision=0.0, level=0):
+    def __init__(
+        self,
+        partition_prior=0.99,
+        prior=None,
+        delta=0,
+        prune=False,
+        split_precision=0.0,
+        n_jobs=None,
+        max_bins=None,
+        level=0,
+    ):
         child_type = PerpendicularRegressionTree
         BasePerpendicularTree.__init__(
-            self, partition_prior, prior, delta, prune, child_type, True, split_precision, level
+            self, partition_prior, prior, delta, prune, child_type, True, split_precision, level, n_jobs, max_bins
+        )
+        BaseRegressionTree.__init__(
+            self, partition_prior, prior, delta, prune, child_type, split_precision, level, n_jobs
         )
-        BaseRegressionTree.__init__(self, partition_prior, prior, delta, prune, child_type, split_precision, level)
 
 
 class HyperplaneRegressionTree(BaseHyperplaneTree, BaseRegressionTree):
@@ -257,6 +277,16 @@ class HyperplaneRegressionTree(BaseHyperplaneTree, BaseRegressionTree):
         Determines the minimum distance between two contiguous points to consider a split. If the distance is below
         this threshold, the points are considered to overlap along this direction.
 
+    n_jobs : int, default=None
+        The number of threads used to train the nodes of the tree and to route the samples through the
+        tree when predicting. `None` means 1 and -1 means using all processors, see joblib.
+
+    use_fp32_projection : bool, default=False
+        If True, the data points are projected onto the candidate hyperplane normals in single precision,
+        which roughly halves the time of the projections on large data sets. The projections are only used
+        to order the data points along the normals, so this rarely changes the splits found, which are
+        still computed in double precision.
+
     level : DO NOT SET, ONLY USED BY SUBCLASSES
 
     See Also:
@@ -283,10 +313,32 @@ class HyperplaneRegressionTree(BaseHyperplaneTree, BaseRegressionTree):
     """
 
     def __init__(
-        self, partition_prior=0.99, prior=None, delta=0, prune=False, optimizer=None, split_precision=0.0, level=0
+        self,
+        partition_prior=0.99,
+        prior=None,
+        delta=0,
+        prune=False,
+        optimizer=None,
+        split_precision=0.0,
+        n_jobs=None,
+        use_fp32_projection=False,
+        level=0,
     ):
         child_type = HyperplaneRegressionTree
         BaseHyperplaneTree.__init__(
-            self, partition_prior, prior, delta, prune, child_type, True, optimizer, split_precision, level
+            self,
+            partition_prior,
+            prior,
+            delta,
+            prune,
+            child_type,
+            True,
+            optimizer,
+            split_precision,
+            level,
+            n_jobs,
+            use_fp32_projection,
+        )
+        BaseRegressionTree.__init__(
+            self, partition_prior, prior, delta, prune, child_type, split_precision, level, n_jobs
         )
-        BaseRegressionTree.__init__(self, partition_prior, prior, delta, prune, child_type, split_precision, level)
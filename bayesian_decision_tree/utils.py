@@ -8,7 +8,7 @@ def multivariate_betaln(alphas):
     if len(alphas) == 2:
         return betaln(alphas[0], alphas[1])
     # see https://en.wikipedia.org/wiki/Beta_function#Multivariate_beta_function
-    return np.sum([gammaln(alpha) for alpha in alphas], axis=0) - gammaln(np.sum(alphas))
+    return np.sum([gammaln(alpha) for alpha in alphas], axis=0) - gammaln(np.sum(alphas, axis=0))
 
 
 def r2_series_generator(n_dim: int) -> Generator[np.ndarray]:
@@ -18,6 +18,29 @@ def r2_series_generator(n_dim: int) -> Generator[np.ndarray]:
     :param n_dim: The number of dimensions of the output
     :return: R2 series data points
     """
+    alpha = _r2_alpha(n_dim)
+
+    # compute R2 sequence
+    i = 0
+    while True:
+        yield (0.5 + alpha * (i + 1)) % 1
+        i += 1
+
+
+def r2_series(n_dim: int, n: int) -> np.ndarray:
+    """Computes the first `n` data points of the R2 pseudo-random sequence at once, see `r2_series_generator()`
+
+    :param n_dim: The number of dimensions of the output
+    :param n: The number of data points
+    :return: R2 series data points, a 2-dimensional array of shape n * n_dim
+    """
+    alpha = _r2_alpha(n_dim)
+
+    # the i-th data point is (0.5 + alpha * i) % 1, for i = 1, ..., n
+    return (0.5 + np.outer(np.arange(1, n + 1), alpha)) % 1
+
+
+def _r2_alpha(n_dim: int) -> np.ndarray:
     if n_dim == 0:
         raise ValueError(f"n_dim must be > 0 but was {n_dim}")
 
@@ -32,13 +55,7 @@ def r2_series_generator(n_dim: int) -> Generator[np.ndarray]:
         phi_old = phi
 
     # compute alpha array
-    alpha = 1 / phi ** (1 + np.arange(n_dim))
-
-    # compute R2 sequence
-    i = 0
-    while True:
-        yield (0.5 + alpha * (i + 1)) % 1
-        i += 1
+    return 1 / phi ** (1 + np.arange(n_dim))
 
 
 def hypercube_to_hypersphere_surface(hypercube_points: np.ndarray, half_hypersphere: bool) -> np.ndarray:
@@ -1,6 +1,6 @@
 import pandas as pd
 from scipy.optimize._differentialevolution import DifferentialEvolutionSolver
-from scipy.sparse import csc_matrix, csr_matrix
+from scipy.sparse import csc_matrix, csr_array, csr_matrix
 
 from bayesian_decision_tree.classification import HyperplaneClassificationTree, PerpendicularClassificationTree
 from bayesian_decision_tree.hyperplane_optimization import (
@@ -16,7 +16,9 @@ data_matrix_transforms = [
     lambda X: X,
     lambda X: csc_matrix(X),
     lambda X: csr_matrix(X),
+    lambda X: csr_array(X),
     lambda X: pd.DataFrame(data=X, columns=[f"col-{i}" for i in range(len(X[0]))]),
+    lambda X: pd.DataFrame(data=X, columns=[f"col-{i}" for i in range(len(X[0]))]).astype(pd.SparseDtype(float, 0)),
 ]
 
 
@@ -4,8 +4,17 @@ import numpy as np
 import pandas as pd
 from numpy.random import normal, randint
 from numpy.testing import assert_array_almost_equal, assert_array_equal
-
-from bayesian_decision_tree.classification import PerpendicularClassificationTree
+from scipy.sparse import csc_matrix
+from sklearn.base import clone
+
+from bayesian_decision_tree.classification import HyperplaneClassificationTree, PerpendicularClassificationTree
+from bayesian_decision_tree.hyperplane_optimization import (
+    HyperplaneOptimizationFunction,
+    QuasiRandomHyperplaneOptimizer,
+    RandomHyperplaneOptimizer,
+    RandomTwoPointOptimizer,
+    ScipyOptimizer,
+)
 from tests.unit.helper import create_classification_trees, data_matrix_transforms
 
 
@@ -454,3 +463,160 @@ class ClassificationTreeTest(TestCase):
             assert_array_almost_equal(fi2, fi3, decimal=1)
             assert_array_almost_equal(fi2, fi4, decimal=1)
             assert_array_almost_equal(fi3, fi4, decimal=1)
+
+    def test_parallel_fit_gives_identical_tree(self):
+        np.random.seed(666)
+        X = normal(0, 1, [200, 4])
+        y = (X[:, 0] + X[:, 2] ** 2 > 0.5).astype(float)
+
+        for data_matrix_transform in data_matrix_transforms:
+            model_serial = PerpendicularClassificationTree(0.9, np.array([1, 1]))
+            model_parallel = PerpendicularClassificationTree(0.9, np.array([1, 1]), n_jobs=2)
+            model_serial.fit(data_matrix_transform(X), y)
+            model_parallel.fit(data_matrix_transform(X), y)
+
+            self.assertEqual(str(model_parallel), str(model_serial))
+            assert_array_equal(model_parallel.predict(X), model_serial.predict(X))
+
+        for model_serial in create_classification_trees(np.array([1, 1]), 0.9):
+            if isinstance(getattr(model_serial, "optimizer", None), (type(None), ScipyOptimizer)):
+                # the scipy solvers are not seeded, so not even two serial fits are guaranteed to agree
+                continue
+
+            model_parallel = clone(model_serial).set_params(n_jobs=2)
+            model_serial.fit(X[:100], y[:100])
+            model_parallel.fit(X[:100], y[:100])
+
+            self.assertEqual(str(model_parallel), str(model_serial))
+
+    def test_parallel_optimizer_gives_identical_tree(self):
+        np.random.seed(666)
+        X = normal(0, 1, [200, 3])
+        y = (X[:, 0] + X[:, 2] ** 2 > 0.5).astype(float)
+
+        for create_optimizer in [
+            lambda n_jobs: RandomTwoPointOptimizer(50, 666, n_jobs=n_jobs),
+            lambda n_jobs: RandomHyperplaneOptimizer(50, 666, n_jobs=n_jobs),
+            lambda n_jobs: QuasiRandomHyperplaneOptimizer(50, n_jobs=n_jobs),
+        ]:
+            for data_matrix_transform in data_matrix_transforms[:2]:
+                model_serial = HyperplaneClassificationTree(0.9, np.array([1, 1]), optimizer=create_optimizer(None))
+                model_parallel = HyperplaneClassificationTree(0.9, np.array([1, 1]), optimizer=create_optimizer(2))
+                model_serial.fit(data_matrix_transform(X), y)
+                model_parallel.fit(data_matrix_transform(X), y)
+
+                self.assertEqual(str(model_parallel), str(model_serial))
+
+    def test_depth_and_n_leaves_after_refit(self):
+        X = np.array([[0.0, 0.0], [0.1, 1.0], [0.9, 0.0], [1.0, 1.0]])
+        for model in create_classification_trees(np.array([1, 1]), 0.7):
+            model.fit(X, np.array([0, 0, 1, 1]))
+            self.assertEqual(model.get_depth(), 1)
+            self.assertEqual(model.get_n_leaves(), 2)
+
+            model.fit(X, np.array([0, 1, 1, 0]))
+            self.assertEqual(model.get_depth(), 0)
+            self.assertEqual(model.get_n_leaves(), 1)
+
+    def test_log_p_split_upper_bound(self):
+        np.random.seed(666)
+        prior = np.array([0.5, 2.0, 1.0])
+        model = PerpendicularClassificationTree(0.9, prior)
+        for y in [randint(0, 3, 50), np.sort(randint(0, 3, 50)), np.ones(50)]:
+            split_indices = np.arange(1, len(y))
+            log_p_data_split = model._compute_log_p_data_split(y, prior, 3, split_indices)
+            log_p_split_upper_bound = model._compute_log_p_split_upper_bound(prior, 3, len(y), len(split_indices))
+            self.assertLessEqual(log_p_data_split.max(), log_p_split_upper_bound + 1e-9)
+
+    def test_hyperplane_split_precision(self):
+        # the data points are 1 apart along x0 (and identical along x1), so no normal can separate any two of them
+        # by more than the split precision, no matter in which order they are
+        np.random.seed(666)
+        x = np.random.permutation(20).astype(float)
+        X = np.column_stack((x, np.zeros(20)))
+        y = (x >= 10).astype(float)
+
+        for split_precision, expected_depth in [(0.0, 1), (1.5, 0)]:
+            model = HyperplaneClassificationTree(
+                0.9, np.array([1, 1]), optimizer=RandomHyperplaneOptimizer(100, 666), split_precision=split_precision
+            )
+            model.fit(X, y)
+            self.assertEqual(model.get_depth(), expected_depth)
+
+    def test_hyperplane_fp32_projection(self):
+        # the single precision projections only affect the ordering of the data points along the normals, so
+        # well separated classes must still be split perfectly, with the splits computed in double precision
+        np.random.seed(666)
+        X = np.vstack((normal(-2, 0.5, (50, 3)), normal(2, 0.5, (50, 3))))
+        y = np.repeat([0.0, 1.0], 50)
+
+        for data_matrix_transform in data_matrix_transforms:
+            model = HyperplaneClassificationTree(
+                0.9, np.array([1, 1]), optimizer=RandomHyperplaneOptimizer(100, 666), use_fp32_projection=True
+            )
+            model.fit(data_matrix_transform(X), y)
+            self.assertEqual(model.get_depth(), 1)
+            assert_array_equal(model.predict(data_matrix_transform(X)), y)
+            self.assertEqual(model.best_hyperplane_normal_.dtype, np.float64)
+
+    def test_hyperplane_evaluate_all(self):
+        np.random.seed(666)
+        X = normal(0, 1, [200, 3])
+        y = (X[:, 0] + X[:, 1] > 0).astype(float)
+
+        prior = np.array([1.0, 1.0])
+        model = HyperplaneClassificationTree(0.9, prior)
+        log_p_data_no_split = model._compute_log_p_data_no_split(y, prior)
+        for data_matrix_transform in [np.asarray, csc_matrix]:
+            for search_space_is_unit_hypercube, hyperplane_normals in [
+                (False, normal(0, 1, [10, 3])),
+                (True, np.random.uniform(0, 1, [10, 2])),
+            ]:
+                optimization_function = HyperplaneOptimizationFunction(
+                    data_matrix_transform(X),
+                    y,
+                    prior,
+                    model._compute_log_p_data_split,
+                    log_p_data_no_split,
+                    search_space_is_unit_hypercube,
+                    0.0,
+                )
+                results = optimization_function.evaluate_all(hyperplane_normals)
+                self.assertEqual(len(results), len(hyperplane_normals))
+                for hyperplane_normal, (log_p, normal_all, split_rows) in zip(hyperplane_normals, results):
+                    expected_log_p, expected_normal, expected_split_rows = optimization_function.evaluate(
+                        hyperplane_normal
+                    )
+                    self.assertAlmostEqual(log_p, expected_log_p)
+                    assert_array_almost_equal(normal_all, expected_normal)
+                    self.assertEqual(split_rows, expected_split_rows)
+
+    def test_compiled_and_numpy_hyperplane_split_search_give_identical_splits(self):
+        np.random.seed(666)
+        X = normal(0, 1, [100, 3])
+        X[:, 2] = np.round(X[:, 2])
+        y = (X[:, 0] > 0).astype(float) + (X[:, 2] > 0)
+
+        prior = np.array([1.0, 1.0, 1.0])
+        model = HyperplaneClassificationTree(0.9, prior)
+        log_p_data_no_split = model._compute_log_p_data_no_split(y, prior)
+        for split_precision in [0.0, 0.5, 100.0]:
+            function_numpy, function_compiled = [
+                HyperplaneOptimizationFunction(
+                    X,
+                    y,
+                    prior,
+                    model._compute_log_p_data_split,
+                    log_p_data_no_split,
+                    False,
+                    split_precision,
+                    find_best_split_compiled=find_best_split_compiled,
+                )
+                for find_best_split_compiled in [None, model._create_find_best_split_compiled(prior, len(y))]
+            ]
+            for hyperplane_normal in [np.array([0.0, 0.0, 1.0]), *normal(0, 1, [10, 3])]:
+                log_p_numpy, normal_numpy, split_rows_numpy = function_numpy.evaluate(hyperplane_normal)
+                log_p_compiled, normal_compiled, split_rows_compiled = function_compiled.evaluate(hyperplane_normal)
+                self.assertAlmostEqual(log_p_compiled, log_p_numpy)
+                assert_array_equal(normal_compiled, normal_numpy)
+                self.assertEqual(split_rows_compiled, split_rows_numpy)
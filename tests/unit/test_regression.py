@@ -1,10 +1,14 @@
 from unittest import TestCase
+from unittest.mock import patch
 
 import numpy as np
-from numpy.testing import assert_array_equal
+import pandas as pd
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+from scipy.sparse import coo_matrix, csc_matrix, csr_matrix
 from sklearn.metrics import mean_squared_error
 
-from bayesian_decision_tree.regression import PerpendicularRegressionTree
+from bayesian_decision_tree.hyperplane_optimization import HyperplaneOptimizationFunction
+from bayesian_decision_tree.regression import HyperplaneRegressionTree, PerpendicularRegressionTree
 from tests.unit.helper import create_regression_trees, data_matrix_transforms
 
 
@@ -149,35 +153,183 @@ class RegressionTreeTest(TestCase):
                     )
 
     def test_decreasing_mse_for_increased_partition_prior(self):
-        for data_matrix_transform in data_matrix_transforms:
-            mu = 0
-            sd_prior = 1
-            prior_obs = 0.01
-            kappa = prior_obs
-            alpha = prior_obs / 2
-            var_prior = sd_prior**2
-            tau_prior = 1 / var_prior
-            beta = alpha / tau_prior
+        mu = 0
+        sd_prior = 1
+        prior_obs = 0.01
+        kappa = prior_obs
+        alpha = prior_obs / 2
+        var_prior = sd_prior**2
+        tau_prior = 1 / var_prior
+        beta = alpha / tau_prior
 
-            prior = np.array([mu, kappa, alpha, beta])
+        prior = np.array([mu, kappa, alpha, beta])
 
-            x = np.linspace(-np.pi / 2, np.pi / 2, 20)
-            y = np.linspace(-np.pi / 2, np.pi / 2, 20)
-            X = np.array([x, y]).T
-            y = np.sin(x) + 3 * np.cos(y)
+        x = np.linspace(-np.pi / 2, np.pi / 2, 20)
+        y = np.linspace(-np.pi / 2, np.pi / 2, 20)
+        X = np.array([x, y]).T
+        y = np.sin(x) + 3 * np.cos(y)
 
-            X = data_matrix_transform(X)
+        partition_priors = [0.1, 0.5, 0.9, 0.99]
+        for data_matrix_transform in data_matrix_transforms:
+            X_transformed = data_matrix_transform(X)
 
-            for i_model in range(len(create_regression_trees(prior, 0.5))):
-                mse_list = []
-                for partition_prior in [0.1, 0.5, 0.9, 0.99]:
-                    model = create_regression_trees(prior, partition_prior)[i_model]
+            # one row of MSEs per partition prior, one column per model flavour
+            mse_table = []
+            for partition_prior in partition_priors:
+                mse_row = []
+                for model in create_regression_trees(prior, partition_prior):
                     print(f"Testing {type(model).__name__}")
-                    model.fit(X, y)
+                    model.fit(X_transformed, y)
                     print(model)
-                    mse = mean_squared_error(y, model.predict(X))
-                    mse_list.append(mse)
+                    mse_row.append(mean_squared_error(y, model.predict(X_transformed)))
+
+                mse_table.append(mse_row)
 
+            for mse_list in zip(*mse_table):
                 self.assertTrue(mse_list[-1] < mse_list[0])
                 for i in range(len(mse_list) - 1):
                     self.assertTrue(mse_list[i + 1] <= mse_list[i])
+
+    def test_sparse_and_dense_data_give_identical_tree(self):
+        np.random.seed(666)
+        X = np.random.normal(0, 1, [300, 5])
+        X[np.random.uniform(0, 1, X.shape) < 0.7] = 0  # mostly zeros, with negative and positive values
+        y = X[:, 0] - 2 * X[:, 3] + np.random.normal(0, 0.1, 300)
+
+        X_csc = csc_matrix(np.where(X == 0, 1, X))
+        X_csc.data[X_csc.data == 1] = 0  # explicitly stored zeros
+
+        prior = np.array([0, 0.01, 0.005, 0.005])
+        model_dense = PerpendicularRegressionTree(0.9, prior).fit(X, y)
+        for X_sparse in [X_csc, csr_matrix(X)]:
+            model_sparse = PerpendicularRegressionTree(0.9, prior).fit(X_sparse, y)
+
+            # identical splits, the posteriors may only differ by round-off (different summation order)
+            self.assertEqual(
+                [(node.split_dimension_, node.split_value_, node.n_data_) for node in model_sparse.nodes_],
+                [(node.split_dimension_, node.split_value_, node.n_data_) for node in model_dense.nodes_],
+            )
+            assert_array_almost_equal(model_sparse.predict(X_sparse), model_dense.predict(X))
+
+    def test_compiled_and_numpy_apply_give_identical_leaves(self):
+        np.random.seed(666)
+        X = np.random.normal(0, 1, [100, 3])
+        X[np.random.uniform(0, 1, X.shape) < 0.5] = 0
+        y = X[:, 0] - 2 * X[:, 2] + np.random.normal(0, 0.1, 100)
+
+        prior = np.array([0, 0.01, 0.005, 0.005])
+        for model in create_regression_trees(prior, 0.9):
+            model.fit(X, y)
+            for X_test in [X, csc_matrix(X), csr_matrix(X), coo_matrix(X)]:
+                leaf_indices = model._apply(X_test)
+                with patch("bayesian_decision_tree.base.NUMBA_AVAILABLE", False):
+                    assert_array_equal(leaf_indices, model._apply(X_test))
+
+    def test_compiled_and_numpy_hyperplane_split_search_give_identical_splits(self):
+        np.random.seed(666)
+        X = np.random.normal(0, 1, [100, 3])
+        X[:, 2] = np.round(X[:, 2])
+        y = X[:, 0] - 2 * X[:, 2] + np.random.normal(0, 0.1, 100)
+
+        prior = np.array([0, 0.01, 0.005, 0.005])
+        model = HyperplaneRegressionTree(0.9, prior)
+        log_p_data_no_split = model._compute_log_p_data_no_split(y, prior)
+        for split_precision in [0.0, 0.5, 100.0]:
+            function_numpy, function_compiled = [
+                HyperplaneOptimizationFunction(
+                    X,
+                    y,
+                    prior,
+                    model._compute_log_p_data_split,
+                    log_p_data_no_split,
+                    False,
+                    split_precision,
+                    find_best_split_compiled=find_best_split_compiled,
+                )
+                for find_best_split_compiled in [None, model._create_find_best_split_compiled(prior, len(y))]
+            ]
+            for hyperplane_normal in [np.array([0.0, 0.0, 1.0]), *np.random.normal(0, 1, [10, 3])]:
+                log_p_numpy, normal_numpy, split_rows_numpy = function_numpy.evaluate(hyperplane_normal)
+                log_p_compiled, normal_compiled, split_rows_compiled = function_compiled.evaluate(hyperplane_normal)
+                self.assertAlmostEqual(log_p_compiled, log_p_numpy)
+                assert_array_equal(normal_compiled, normal_numpy)
+                self.assertEqual(split_rows_compiled, split_rows_numpy)
+
+    def test_value_ranks_of_dense_and_sparse_data(self):
+        np.random.seed(666)
+        X = np.round(np.random.normal(0, 1, [200, 4]), 1)
+        X[np.random.uniform(0, 1, X.shape) < 0.5] = 0
+
+        for X_fit in [X, csc_matrix(X)]:
+            dense = isinstance(X_fit, np.ndarray)
+            sort_indices_by_dim = np.array(
+                [
+                    np.argsort(X[:, dim]) if dense else PerpendicularRegressionTree._argsort_sparse_column(X_fit, dim)
+                    for dim in range(X.shape[1])
+                ]
+            )
+            value_ranks_by_dim = PerpendicularRegressionTree._compute_value_ranks(X_fit, sort_indices_by_dim, dense)
+            for dim in range(X.shape[1]):
+                assert_array_equal(value_ranks_by_dim[dim], np.unique(X[:, dim], return_inverse=True)[1])
+
+    def test_binning(self):
+        np.random.seed(666)
+        X = np.round(np.random.normal(0, 1, [300, 3]), 1)
+        y = X[:, 0] - 2 * X[:, 2] + np.random.normal(0, 0.1, 300)
+
+        prior = np.array([0, 0.01, 0.005, 0.005])
+        for X_fit in [X, csc_matrix(X)]:
+            # at least one bin per distinct value: same tree as without binning
+            model = PerpendicularRegressionTree(0.9, prior).fit(X_fit, y)
+            model_binned = PerpendicularRegressionTree(0.9, prior, max_bins=256).fit(X_fit, y)
+            self.assertEqual(str(model_binned), str(model))
+
+            # few bins: only split between bins
+            model_binned = PerpendicularRegressionTree(0.9, prior, max_bins=4).fit(X_fit, y)
+            self.assertGreater(model_binned.get_n_leaves(), 1)
+            for node in model_binned.nodes_:
+                if not node.is_leaf():
+                    bin_edges = np.quantile(X[:, node.split_dimension_], [0.25, 0.5, 0.75], method="lower")
+                    self.assertLess(np.abs(bin_edges - node.split_value_).min(), 0.1)
+
+        for max_bins in [0, 1, 100000]:
+            with self.assertRaises(ValueError):
+                PerpendicularRegressionTree(0.9, prior, max_bins=max_bins).fit(X, y)
+
+    def test_prediction_paths_of_deep_tree(self):
+        np.random.seed(666)
+        X = np.random.normal(0, 1, [300, 3])
+        y = np.sin(3 * X[:, 0]) + X[:, 1] + np.random.normal(0, 0.1, 300)
+
+        model = PerpendicularRegressionTree(0.99, np.array([0, 0.01, 0.005, 0.005])).fit(X, y)
+        self.assertGreater(model.get_depth(), 2)
+
+        for x, path in zip(X, model.prediction_paths(X)):
+            expected_path = []
+            node = model
+            while not node.is_leaf():
+                go_right = x[node.split_dimension_] >= node.split_value_
+                expected_path.append((node.split_dimension_, node.split_feature_name_, node.split_value_, go_right))
+                node = node.child2_ if go_right else node.child1_
+
+            self.assertEqual(path, expected_path)
+
+    def test_target_as_series_with_custom_index(self):
+        np.random.seed(666)
+        X = np.random.normal(0, 1, [100, 2])
+        y = X[:, 0] + np.random.normal(0, 0.1, 100)
+
+        prior = np.array([0, 0.01, 0.005, 0.005])
+        model = PerpendicularRegressionTree(0.9, prior).fit(X, y)
+        model_series = PerpendicularRegressionTree(0.9, prior).fit(X, pd.Series(y, index=np.arange(100)[::-1] + 1000))
+        self.assertEqual(str(model_series), str(model))
+
+    def test_log_p_split_upper_bound(self):
+        np.random.seed(666)
+        prior = np.array([0.5, 0.5, 1.5, 0.2])
+        model = PerpendicularRegressionTree(0.9, prior)
+        for y in [np.random.normal(0, 1, 50), np.random.normal(3, 0.01, 50), np.full(50, 0.5)]:
+            split_indices = np.arange(1, len(y))
+            log_p_data_split = model._compute_log_p_data_split(y, prior, 3, split_indices)
+            log_p_split_upper_bound = model._compute_log_p_split_upper_bound(prior, 3, len(y), len(split_indices))
+            self.assertLessEqual(log_p_data_split.max(), log_p_split_upper_bound + 1e-9)
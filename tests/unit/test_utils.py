@@ -2,9 +2,9 @@ import itertools
 from unittest import TestCase
 
 import numpy as np
-from numpy.testing import assert_almost_equal
+from numpy.testing import assert_almost_equal, assert_array_equal
 
-from bayesian_decision_tree.utils import hypercube_to_hypersphere_surface
+from bayesian_decision_tree.utils import hypercube_to_hypersphere_surface, r2_series, r2_series_generator
 
 
 class UtilsTest(TestCase):
@@ -195,3 +195,14 @@ class UtilsTest(TestCase):
                 max = n_points / 2**6 * (1 + tolerance_fraction)
                 msg = f"Expected a value between {min:.0f} and {max:.0f} in quadrant {quadrant_signs}, but was {in_quadrant}"
                 self.assertTrue(min <= np.sum(in_quadrant) <= max, msg)
+
+    def test_r2_series(self):
+        for n_dim in [1, 2, 5]:
+            r2gen = r2_series_generator(n_dim)
+            expected = np.array([next(r2gen) for i in range(100)])
+
+            r2 = r2_series(n_dim, 100)
+            self.assertEqual(r2.shape, (100, n_dim))
+            assert_array_equal(r2, expected)
+
+        self.assertRaises(ValueError, r2_series, 0, 100)